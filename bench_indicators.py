@@ -0,0 +1,445 @@
+"""Valores de referencia y rendimiento de indicadores y señales.
+
+Ejecuta cada indicador y señal sobre velas sintéticas deterministas, comprueba que
+las distintas implementaciones coinciden (kernels NumPy frente a las fórmulas pandas
+originales, en bloque frente a streaming y planes de indicadores, por símbolo frente
+a en bloque) e informa de las velas/s. Sin red: los exchanges se sustituyen por un
+mock que sirve las velas sintéticas.
+
+Desde la raíz del repositorio:
+
+    python ./bench_indicators.py                    # 100 .. 1M velas
+    python ./bench_indicators.py --quick            # 100 .. 10k velas
+    python ./bench_indicators.py --sizes 1000,50000
+
+Sale con código 1 si falla alguna comprobación, para detectar regresiones antes y
+después de optimizar.
+"""
+import os
+import sys
+import time
+import types
+import argparse
+import numpy as np
+import pandas as pd
+
+# Variables de entorno seguras: los bots las leen al importarse
+os.environ['PAPER_TRADE'] = 'true'
+os.environ['USE_TESTNET'] = 'false'
+os.environ.setdefault('SYMBOLS', 'BTC/USDT')
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import utilities.indicators as ind
+from utilities import build_features as bf
+from utilities.combined_strategy import FEATURES, get_combined_signal, get_combined_signals, get_combined_signal_series
+from utilities import cerebro
+
+SIZES = (100, 1_000, 10_000, 100_000, 1_000_000)
+QUICK_SIZES = (100, 1_000, 10_000)
+# Velas que se pasan una a una a los indicadores incrementales (Python puro, ~10 us por vela)
+STREAM_MAX_BARS = 100_000
+# Ventanas evaluadas con las funciones de señal de una vela
+SIGNAL_WINDOWS = 300
+# Histórico máximo en el que get_combined_signal_series se compara vela a vela con los prefijos
+SERIES_MAX_BARS = 100_000
+WINDOW = 250
+SEED = 7
+
+# Últimos valores con synthetic_candles(1000): detectan cambios que moverían todas las implementaciones a la vez
+GOLDEN = {
+    'SMA_FAST': 29981.89024877341,
+    'SMA_TREND': 28818.178490818882,
+    'MACD': 37.96200710325138,
+    'MACD_SIGNAL': 42.070558113426785,
+    'ATR': 129.29491251643984,
+    'RSI': 58.986136448420254,
+    'STOCH_RSI_K': 55.247758035154725,
+    'STOCH_RSI_D': 75.87618886837352,
+}
+GOLDEN_BARS = 1_000
+
+# ----------------------------- Datos sintéticos -----------------------------
+
+def synthetic_candles(n: int, seed: int = SEED) -> pd.DataFrame:
+    """Velas de 1h deterministas: paseo aleatorio log-normal con un tramo plano (casos límite de RSI/StochRSI)."""
+    rng = np.random.default_rng(seed)
+    close = 40000.0 * np.exp(np.cumsum(rng.normal(0.0, 0.004, n)))
+    if n > 200:
+        close[120:150] = close[120]
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * (1.0 + rng.uniform(0.0, 0.002, n))
+    low = np.minimum(open_, close) * (1.0 - rng.uniform(0.0, 0.002, n))
+    return pd.DataFrame({
+        'timestamp': 1_600_000_000_000 + np.arange(n, dtype=np.int64) * 3_600_000,
+        'open': open_, 'high': high, 'low': low, 'close': close,
+        'volume': rng.uniform(1.0, 100.0, n),
+    })
+
+class MockExchange:
+    """Sirve las velas sintéticas con las llamadas de ccxt que usa cerebro."""
+
+    id = 'mock'
+
+    def __init__(self, df: pd.DataFrame):
+        self.bars = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].to_numpy().tolist()
+
+    def milliseconds(self):
+        return int(self.bars[-1][0]) + 1
+
+    def fetch_ohlcv(self, symbol, timeframe='1h', limit=300, since=None):
+        return self.bars[-limit:]
+
+# ----------------------------- Referencias pandas -----------------------------
+# Las fórmulas que usaban los bots antes de los kernels NumPy (y pandas_ta 0.3.14b en cerebro).
+
+def calculate_rsi(df: pd.DataFrame, period: int) -> pd.Series:
+    delta = df['close'].diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+    rsi = 100 - (100 / (1 + gain / loss))
+    rsi.loc[loss == 0] = 100
+    rsi.loc[gain == 0] = 0
+    return rsi
+
+def calculate_stoch_rsi_series(rsi_series: pd.Series, period: int):
+    rsi_min = rsi_series.rolling(window=period).min()
+    rsi_max = rsi_series.rolling(window=period).max()
+    k = 100 * ((rsi_series - rsi_min) / (rsi_max - rsi_min))
+    k.loc[rsi_max == rsi_min] = 50
+    d = k.rolling(window=period).mean()
+    return k, d
+
+def reference_features(df: pd.DataFrame) -> pd.DataFrame:
+    """build_features tal como estaba escrito con pandas."""
+    df = df.copy()
+    df['SMA_FAST'] = df['close'].rolling(window=bf.SMA_FAST).mean()
+    df['SMA_TREND'] = df['close'].rolling(window=bf.SMA_TREND).mean()
+    ema_fast = df['close'].ewm(span=bf.MACD_FAST, adjust=False).mean()
+    ema_slow = df['close'].ewm(span=bf.MACD_SLOW, adjust=False).mean()
+    df['MACD'] = ema_fast - ema_slow
+    df['MACD_SIGNAL'] = df['MACD'].ewm(span=bf.MACD_SIGNAL, adjust=False).mean()
+    high_low = df['high'] - df['low']
+    high_close = (df['high'] - df['close'].shift()).abs()
+    low_close = (df['low'] - df['close'].shift()).abs()
+    tr = np.maximum(np.maximum(high_low, high_close), low_close)
+    df['ATR'] = tr.rolling(window=bf.ATR_PERIOD).mean()
+    df['RSI'] = calculate_rsi(df, bf.RSI_PERIOD)
+    df['STOCH_RSI_K'], df['STOCH_RSI_D'] = calculate_stoch_rsi_series(df['RSI'], bf.STOCH_RSI_PERIOD)
+    return df
+
+def ta_ema(close: pd.Series, length: int) -> pd.Series:
+    close = close.copy()
+    seed = close[0:length].mean()
+    close[:length - 1] = np.nan
+    close.iloc[length - 1] = seed
+    return close.ewm(span=length, adjust=False).mean()
+
+def ta_rsi(close: pd.Series, length: int = 14) -> pd.Series:
+    negative = close.diff(1)
+    positive = negative.copy()
+    positive[positive < 0] = 0
+    negative[negative > 0] = 0
+    gain = positive.ewm(alpha=1.0 / length, min_periods=length).mean()
+    loss = negative.ewm(alpha=1.0 / length, min_periods=length).mean()
+    return 100 * gain / (gain + loss.abs())
+
+def ta_macd(close: pd.Series, fast: int = 12, slow: int = 26, signal: int = 9):
+    macd = ta_ema(close, fast) - ta_ema(close, slow)
+    signal_line = ta_ema(macd.loc[macd.first_valid_index():], signal)
+    return macd, signal_line, macd - signal_line
+
+def reference_cerebro(df: pd.DataFrame) -> pd.DataFrame:
+    """calcular_indicadores con pandas_ta (sma, rsi y macd)."""
+    df = df.copy()
+    df['sma200'] = df['close'].rolling(cerebro.SMA_TENDENCIA, min_periods=cerebro.SMA_TENDENCIA).mean()
+    df['rsi'] = ta_rsi(df['close'], 14)
+    df['MACD_12_26_9'], df['MACDs_12_26_9'], df['MACDh_12_26_9'] = ta_macd(df['close'])
+    return df
+
+# ----------------------------- Comprobaciones y tiempos -----------------------------
+
+results = []
+failures = []
+
+def timed(func, repeat: int = 1):
+    """Ejecuta `func` `repeat` veces; devuelve (último resultado, segundos por ejecución)."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = func()
+    return out, (time.perf_counter() - start) / repeat
+
+def repeats(n: int) -> int:
+    return max(1, min(50, 200_000 // max(n, 1)))
+
+def agree(name: str, n: int, got, expected, rtol: float = 1e-9) -> bool:
+    """Mismos NaN en las mismas posiciones y valores dentro de `rtol` respecto a la escala de la serie."""
+    got, expected = np.asarray(got, dtype=float), np.asarray(expected, dtype=float)
+    ok = got.shape == expected.shape and np.array_equal(np.isnan(got), np.isnan(expected))
+    err = np.nan
+    if ok and np.isfinite(expected).any():
+        scale = np.nanmax(np.abs(expected)) or 1.0
+        err = np.nanmax(np.abs(got - expected)) / scale
+        ok = err <= rtol
+    if not ok:
+        failures.append(f"{name} (n={n}): error relativo máximo {err:.3g}, mismos NaN: "
+                        f"{got.shape == expected.shape and np.array_equal(np.isnan(got), np.isnan(expected))}")
+    return ok
+
+def report(name: str, n: int, seconds: float, ok=None, bars: int = None):
+    bars = n if bars is None else bars
+    results.append((name, n, seconds, bars / seconds if seconds else float('inf'), ok))
+
+def check_kernels(df: pd.DataFrame):
+    n = len(df)
+    close, high, low = df['close'], df['high'], df['low']
+    r = repeats(n)
+
+    for period in (14, 200):
+        got, sec = timed(lambda: ind.sma(close, period), r)
+        report(f"sma({period})", n, sec, agree(f"sma({period})", n, got, close.rolling(period).mean()))
+    for span in (12, 26):
+        got, sec = timed(lambda: ind.ema(close, span), r)
+        report(f"ema({span})", n, sec, agree(f"ema({span})", n, got, close.ewm(span=span, adjust=False).mean()))
+
+    got, sec = timed(lambda: ind.macd(close, 12, 26, 9), r)
+    ema_line = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    ok = agree("macd", n, got[0], ema_line) & agree("macd_signal", n, got[1], ema_line.ewm(span=9, adjust=False).mean())
+    report("macd(12,26,9)", n, sec, ok)
+
+    tr = pd.concat([high - low, (high - close.shift()).abs(), (low - close.shift()).abs()], axis=1).max(axis=1)
+    got, sec = timed(lambda: ind.atr(high, low, close, 14, first_bar_range=True), r)
+    report("atr(14)", n, sec, agree("atr", n, got, tr.rolling(14).mean()))
+
+    reference_rsi = calculate_rsi(df, 14)
+    got, sec = timed(lambda: ind.rsi(close, 14), r)
+    report("calculate_rsi -> rsi(14)", n, sec, agree("rsi", n, got, reference_rsi))
+    got, sec = timed(lambda: ind.rsi(close, 14, wilder=True), r)
+    report("rsi(14, wilder)", n, sec, agree("rsi wilder", n, got, ta_rsi(close, 14)))
+
+    rsi = ind.rsi(close, 14)
+    got, sec = timed(lambda: ind.stoch_rsi(rsi, 14), r)
+    k, d = calculate_stoch_rsi_series(reference_rsi, 14)
+    report("calculate_stoch_rsi_series -> stoch_rsi(14)", n, sec,
+           agree("stoch_k", n, got[0], k, 1e-7) & agree("stoch_d", n, got[1], d, 1e-7))
+    for period in (14, 2000):
+        got, sec = timed(lambda: ind.rolling_min(rsi, period), r)
+        report(f"rolling_min({period})", n, sec, agree(f"rolling_min({period})", n, got, pd.Series(rsi).rolling(period).min()))
+
+    periods, spans = list(range(10, 310, 10)), list(range(5, 65, 2))
+    got, sec = timed(lambda: ind.sma_sweep(close, periods), r)
+    report(f"sma_sweep({len(periods)} periods)", n, sec,
+           agree("sma_sweep", n, got, np.stack([ind.sma(close, p) for p in periods]), 0.0), n * len(periods))
+    got, sec = timed(lambda: ind.ema_sweep(close, spans), r)
+    report(f"ema_sweep({len(spans)} spans)", n, sec,
+           agree("ema_sweep", n, got, np.stack([ind.ema(close, s) for s in spans]), 0.0), n * len(spans))
+
+def check_features(df: pd.DataFrame):
+    n = len(df)
+    r = repeats(n)
+    reference = reference_features(df)
+    columns = list(GOLDEN)
+
+    got, sec = timed(lambda: bf.build_features(df), r)
+    ok = all([agree(f"build_features {c}", n, got[c], reference[c], 1e-7) for c in columns])
+    report("build_features", n, sec, ok)
+
+    # Los planes solo rellenan las filas que lee la estrategia
+    got, sec = timed(lambda: FEATURES(df), r)
+    ok = True
+    for name, (start, rows) in FEATURES.starts(n).items():
+        if rows:
+            ok &= agree(f"FEATURES {name}", n, got[name].to_numpy()[-rows:], reference[name].to_numpy()[-rows:], 1e-7)
+    report("combined_strategy.FEATURES (plan)", n, sec, ok)
+
+    if n <= STREAM_MAX_BARS:
+        def streamed():
+            stream = bf.new_feature_stream()
+            stream.rows = type(stream.rows)(maxlen=n)
+            stream.seed(df)
+            return stream.columns(n)
+        got, sec = timed(streamed)
+        ok = all([agree(f"FeatureStream {c}", n, got[c], reference[c], 1e-7) for c in columns if c in got])
+        report("FeatureStream (vela a vela)", n, sec, ok)
+
+    if n > WINDOW:
+        # DataFrame de los bots (timestamp como fecha): la vela nueva debe avanzar el stream, no resembrarlo
+        dated = df.iloc[-WINDOW - 1:].assign(timestamp=pd.to_datetime(df['timestamp'].iloc[-WINDOW - 1:], unit='ms'))
+        key = ('bench', n)
+        bf.streamed_features(key, dated.iloc[:-1].reset_index(drop=True))
+        seeded = bf.feature_streams.get(key)
+        got, sec = timed(lambda: bf.streamed_features(key, dated.iloc[1:].reset_index(drop=True)))
+        expected = bf.new_feature_stream()
+        expected.seed(dated)
+        expected = expected.columns(WINDOW)
+        ok = bf.feature_streams.get(key) is seeded and len(seeded) == WINDOW + 1
+        if not ok:
+            failures.append(f"streamed_features (n={n}): una vela nueva en un DataFrame resembró el stream")
+        ok &= all([agree(f"streamed_features {c}", n, got[c], expected[c], 0.0) for c in columns])
+        report("streamed_features (DataFrame, +1 vela)", n, sec, ok, 1)
+
+    if n == GOLDEN_BARS:
+        features = bf.build_features(df)
+        for column, value in GOLDEN.items():
+            last = float(features[column].iloc[-1])
+            if not np.isclose(last, value, rtol=1e-9, atol=0.0):
+                failures.append(f"golden {column}: {last!r} != {value!r}")
+
+def windows(df: pd.DataFrame):
+    """Inicio de hasta SIGNAL_WINDOWS ventanas de WINDOW velas repartidas por `df`."""
+    if len(df) < WINDOW:
+        return []
+    return np.unique(np.linspace(0, len(df) - WINDOW, SIGNAL_WINDOWS).astype(int))
+
+def check_signals(df: pd.DataFrame, min_vol: float = 0.5, max_vol: float = 3.0):
+    n = len(df)
+    starts = windows(df)
+    if not len(starts):
+        return
+    frames = [df.iloc[s:s + WINDOW].reset_index(drop=True) for s in starts]
+    featured = [FEATURES(frame) for frame in frames]
+    reference = [reference_features(frame) for frame in frames]
+
+    got, sec = timed(lambda: [get_combined_signal(frame, min_vol, max_vol) for frame in featured])
+    expected = [get_combined_signal(frame, min_vol, max_vol) for frame in reference]
+    mismatches = sum(a != b for a, b in zip(got, expected))
+    if mismatches:
+        failures.append(f"get_combined_signal (n={n}): {mismatches}/{len(starts)} ventanas difieren de los indicadores pandas")
+    report("get_combined_signal (por ventana)", n, sec, not mismatches, len(starts) * WINDOW)
+
+    block = {name: np.stack([frame[name].to_numpy() for frame in frames]) for name in ('high', 'low', 'close')}
+    def batched():
+        features = FEATURES.arrays(block['high'], block['low'], block['close'])
+        features['close'] = block['close']
+        return get_combined_signals(features, min_vol, max_vol)
+    (signals, scores), sec = timed(batched, repeats(n))
+    mismatches = sum((signals[i], scores[i]) != got[i] for i in range(len(starts)))
+    if mismatches:
+        failures.append(f"get_combined_signals (n={n}): {mismatches}/{len(starts)} ventanas difieren de get_combined_signal")
+    report("get_combined_signals (en bloque)", n, sec, not mismatches, len(starts) * WINDOW)
+
+    # Todo el histórico de una vez frente a la función de una vela sobre los prefijos que acaban en esas velas
+    features = bf.build_features(df)
+    (signals, scores), sec = timed(lambda: get_combined_signal_series(features, min_vol, max_vol), repeats(n))
+    ok = True
+    if n <= SERIES_MAX_BARS:
+        ends = np.unique(np.r_[starts + WINDOW - 1, np.flatnonzero(signals != 'NEUTRAL')[:SIGNAL_WINDOWS]])
+        mismatches = sum(get_combined_signal(features.iloc[:i + 1], min_vol, max_vol) != (signals[i], scores[i])
+                         for i in ends)
+        if mismatches:
+            failures.append(f"get_combined_signal_series (n={n}): {mismatches}/{len(ends)} velas difieren de get_combined_signal")
+        ok = not mismatches
+    report("get_combined_signal_series (todo el histórico)", n, sec, ok)
+
+def check_cerebro(df: pd.DataFrame):
+    n = len(df)
+    got, sec = timed(lambda: cerebro.calcular_indicadores(df), repeats(n))
+    reference = reference_cerebro(df)
+    ok = all([agree(f"cerebro {c}", n, got[c], reference[c], 1e-7)
+              for c in ('sma200', 'rsi', 'MACD_12_26_9', 'MACDh_12_26_9', 'MACDs_12_26_9')])
+    report("cerebro.calcular_indicadores", n, sec, ok)
+
+    if n < 300:
+        return
+    exchange = MockExchange(df.iloc[-300:])
+    def consult():
+        cerebro.cache_velas.clear()  # medir el cálculo, no los aciertos de caché
+        return cerebro.consultar_senal_mercado(exchange, 'BTC/USDT')
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        signal, sec = timed(consult, 20)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    last = reference_cerebro(df.iloc[-300:].reset_index(drop=True)).iloc[-2]
+    expected = 'long' if last['close'] > last['sma200'] and last['MACDh_12_26_9'] > 0 else \
+               'short' if last['close'] < last['sma200'] and last['MACDh_12_26_9'] < 0 else None
+    ok = signal.get('lado') == expected and signal['entrar'] == (expected is not None)
+    if not ok:
+        failures.append(f"consultar_senal_mercado (n={n}): {signal} vs {expected}")
+    report("cerebro.consultar_senal_mercado", n, sec, ok, 300)
+
+def load_bot(path: str, name: str):
+    """Importa el script de un bot como módulo (el bot de scalping usa atajos de `keyboard`: se simulan)."""
+    import importlib.util
+    if 'keyboard' not in sys.modules:
+        keyboard = types.ModuleType('keyboard')
+        keyboard.add_hotkey = lambda *args, **kwargs: None
+        sys.modules['keyboard'] = keyboard
+    spec = importlib.util.spec_from_file_location(name, os.path.join(os.path.dirname(os.path.abspath(__file__)), path))
+    module = importlib.util.module_from_spec(spec)
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return module
+
+def check_bot_variants(df: pd.DataFrame, bots: dict):
+    """FeaturePlans y decisiones de decision_bot y del bot de scalping frente a las fórmulas pandas."""
+    n = len(df)
+    starts = windows(df)
+    if not len(starts):
+        return
+    frames = [df.iloc[s:s + WINDOW].reset_index(drop=True) for s in starts]
+    for label, bot in bots.items():
+        def reference(frame):
+            close = frame['close']
+            line = close.ewm(span=bot.MACD_FAST, adjust=False).mean() - close.ewm(span=bot.MACD_SLOW, adjust=False).mean()
+            return frame.assign(sma_trend=close.rolling(bot.SMA_TREND).mean(), macd=line,
+                                macd_signal=line.ewm(span=bot.MACD_SIGNAL, adjust=False).mean())
+
+        featured, sec = timed(lambda: [bot.FEATURES(frame) for frame in frames])
+        expected = [reference(frame) for frame in frames]
+        if label == 'decision_bot':
+            decide = lambda frame: (bot.get_sma_decision(frame), bot.get_macd_decision(frame))
+        else:
+            decide = lambda frame: tuple(f(frame, mode) for mode in ('automatic_sma', 'automatic_macd')
+                                         for f in (bot.check_entry_long, bot.check_entry_short))
+            for frame in expected:
+                tr = pd.concat([frame['high'] - frame['low'], (frame['high'] - frame['close'].shift()).abs(),
+                                (frame['low'] - frame['close'].shift()).abs()], axis=1).max(axis=1)
+                frame['atr'] = tr.rolling(bot.ATR_PERIOD).mean()
+        mismatches = sum(decide(a) != decide(b) for a, b in zip(featured, expected))
+        if mismatches:
+            failures.append(f"{label} (n={n}): {mismatches}/{len(starts)} ventanas deciden distinto")
+        report(f"{label}.FEATURES (por ventana)", n, sec, not mismatches, len(starts) * WINDOW)
+
+# ----------------------------- Principal -----------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='solo 100 .. 10k velas')
+    parser.add_argument('--sizes', help='números de velas separados por comas')
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(',')] if args.sizes else (QUICK_SIZES if args.quick else SIZES)
+
+    bots = {
+        'decision_bot': load_bot('bots/decision_bot/decision_bot.py', 'decision_bot'),
+        'scalping_bot': load_bot('bots/scalping_bot/bot_scalping_trading.py', 'bot_scalping_trading'),
+    }
+
+    for n in sorted(set(sizes) | {GOLDEN_BARS}):
+        df = synthetic_candles(n)
+        print(f"--- {n} velas ---")
+        check_kernels(df)
+        check_features(df)
+        check_signals(df)
+        check_cerebro(df)
+        check_bot_variants(df, bots)
+
+    print(f"\n{'función':46} {'velas':>9} {'ms':>10} {'velas/s':>12}  comprobación")
+    for name, n, seconds, rate, ok in results:
+        status = '-' if ok is None else ('ok' if ok else 'FAIL')
+        print(f"{name:46} {n:>9} {seconds * 1e3:>10.3f} {rate:>12,.0f}  {status}")
+
+    if failures:
+        print(f"\n{len(failures)} comprobación(es) fallida(s):")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\nTodas las comprobaciones correctas.")
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,14 @@ import ccxt
 from datetime import datetime
 from dotenv import load_dotenv
 
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from utilities.build_features import closed_features
+from utilities.feature_graph import FeaturePlan
+from utilities.async_scan import AsyncScanner
+from utilities.scheduler import Scheduler
+
 # ----------------------------- Utilidades -----------------------------
 
 def ts():
@@ -30,7 +38,6 @@ SMA_TREND = int(os.getenv("SMA_TREND", "200"))
 MACD_FAST = int(os.getenv("MACD_FAST", "12"))
 MACD_SLOW = int(os.getenv("MACD_SLOW", "26"))
 MACD_SIGNAL = int(os.getenv("MACD_SIGNAL", "9"))
-LOOP_SLEEP_SEC = int(os.getenv("LOOP_SLEEP_SEC", "10"))
 
 # Lee los parámetros desde la línea de comandos
 #SYMBOL = sys.argv[1].upper()
@@ -51,32 +58,12 @@ exchange = ccxt.binance()
 
 # ----------------------------- Indicadores y Lógica -----------------------------
 
-def fetch_ohlcv_df(SYMBOL):
-    try:
-        ohlcv = exchange.fetch_ohlcv(SYMBOL, timeframe=TIMEFRAME, limit=DATA_LIMIT)
-        df = pd.DataFrame(ohlcv, columns=["timestamp", "open", "high", "low", "close", "volume"])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        return df
-    except Exception as e:
-        print(f"Error al obtener datos para {SYMBOL} en {TIMEFRAME}: {e}")
-        return pd.DataFrame()
-
-def sma(series: pd.Series, period: int) -> pd.Series:
-    return series.rolling(window=period, min_periods=period).mean()
-
-def macd(series: pd.Series, fast: int, slow: int, signal: int):
-    exp1 = series.ewm(span=fast, adjust=False).mean()
-    exp2 = series.ewm(span=slow, adjust=False).mean()
-    macd_line = exp1 - exp2
-    signal_line = macd_line.ewm(span=signal, adjust=False).mean()
-    hist = macd_line - signal_line
-    return macd_line, signal_line, hist
-
-def build_features(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df['sma_trend'] = sma(df['close'], SMA_TREND)
-    df['macd'], df['macd_signal'], df['macd_hist'] = macd(df['close'], MACD_FAST, MACD_SLOW, MACD_SIGNAL)
-    return df
+# Solo los indicadores que leen las decisiones: la SMA de la última vela y el MACD de las dos últimas
+FEATURES = FeaturePlan({
+    'sma_trend': ('sma', SMA_TREND),
+    'macd': ('macd', MACD_FAST, MACD_SLOW, MACD_SIGNAL),
+    'macd_signal': ('macd_signal', MACD_FAST, MACD_SLOW, MACD_SIGNAL),
+}, rows={'sma_trend': 1, 'macd': 2, 'macd_signal': 2})
 
 def get_sma_decision(df: pd.DataFrame) -> tuple:
     last = df.iloc[-1]
@@ -95,41 +82,41 @@ def get_macd_decision(df: pd.DataFrame) -> tuple:
         return "SHORT", 100
     return "NEUTRAL", 0
 
+def evaluate_symbol(symbol: str, df: pd.DataFrame):
+    if df.empty or len(df) < max(SMA_TREND, MACD_SLOW):
+        print(f"{ts()} | Datos insuficientes para {symbol}, esperando...")
+        return
+    # Solo velas cerradas: los indicadores se calculan una vez por vela
+    df = closed_features((exchange.id, symbol, TIMEFRAME), df, FEATURES)
+    sma_decision, sma_certainty = get_sma_decision(df)
+    macd_decision, macd_certainty = get_macd_decision(df)
+    print(f"{ts()} | Símbolo: {symbol} | Timeframe: {TIMEFRAME}")
+    print(f"SMA: Decisión: {sma_decision} | Certeza: {sma_certainty}%")
+    print(f"MACD: Decisión: {macd_decision} | Certeza: {macd_certainty}%")              
+    print("-" * 50)
+
 # ----------------------------- Bucle Principal -----------------------------
 
 def main_loop():
-    print(f"\n{ts()} | Bot de decisión iniciado para {SYMBOLS} en el timeframe {TIMEFRAME}. Repitiendo cada {LOOP_SLEEP_SEC} segundos.")
+    print(f"\n{ts()} | Bot de decisión iniciado para {SYMBOLS} en el timeframe {TIMEFRAME}. Evaluando al cierre de cada vela.")
     print("Presione Ctrl+C para salir.\n")
+    scanner = AsyncScanner(exchange.id)
+    scheduler = Scheduler(exchange)
 
-    while True:
-        try:
-            # Lista de símbolos a escanear. Puedes modificarla o usar get_top_trading_symbols()
-            symbols_to_scan = [s.strip() for s in SYMBOLS.split(',')]
-
-            if not symbols_to_scan:
-                print(f"{ts()} | No se pudieron obtener los símbolos. Reintentando...")
-                time.sleep(60)
-                continue
-                
-            for symbol in symbols_to_scan:
-                df = fetch_ohlcv_df(symbol)
-                if df.empty or len(df) < max(SMA_TREND, MACD_SLOW):
-                     print(f"{ts()} | Datos insuficientes, esperando...")
-                     time.sleep(LOOP_SLEEP_SEC)
-                     continue
-                df = build_features(df)
-                sma_decision, sma_certainty = get_sma_decision(df)
-                macd_decision, macd_certainty = get_macd_decision(df)
-                print(f"{ts()} | Símbolo: {symbol} | Timeframe: {TIMEFRAME}")
-                print(f"SMA: Decisión: {sma_decision} | Certeza: {sma_certainty}%")
-                print(f"MACD: Decisión: {macd_decision} | Certeza: {macd_certainty}%")              
-                print("-" * 50)
-            
-            time.sleep(LOOP_SLEEP_SEC)
-        
-        except Exception as e:
-            print(f"{ts()} | Error inesperado: {e}")
-            time.sleep(LOOP_SLEEP_SEC)
+    def scan_symbols():
+        # Lista de símbolos a escanear. Puedes modificarla o usar get_top_trading_symbols()
+        symbols_to_scan = [s.strip() for s in SYMBOLS.split(',')]
+        if not symbols_to_scan:
+            raise ValueError("No se pudieron obtener los símbolos")
+
+        # Descarga concurrente de todos los símbolos y evaluación en orden
+        scanner.scan(symbols_to_scan, TIMEFRAME, DATA_LIMIT, evaluate_symbol)
+
+    scheduler.every(TIMEFRAME, scan_symbols)
+    try:
+        scheduler.run()
+    finally:
+        scanner.close()
             
 if __name__ == "__main__":
     try:
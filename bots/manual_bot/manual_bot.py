@@ -9,6 +9,11 @@ from dotenv import load_dotenv
 import keyboard
 import numpy as np
 
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import utilities.indicators as ind
+
 # ----------------------------- Utilidades -----------------------------
 
 def ts():
@@ -103,17 +108,8 @@ def fetch_ohlcv_df(symbol: str, timeframe: str, limit: int) -> pd.DataFrame:
     df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
     return df
 
-def atr(df: pd.DataFrame, period: int = 14) -> pd.Series:
-    high = df['high']
-    low = df['low']
-    close = df['close']
-    prev_close = close.shift(1)
-    tr = pd.concat([
-        high - low,
-        (high - prev_close).abs(),
-        (low - prev_close).abs()
-    ], axis=1).max(axis=1)
-    return tr.rolling(period).mean()
+def atr(df: pd.DataFrame, period: int = 14) -> np.ndarray:
+    return ind.atr(df['high'], df['low'], df['close'], period, first_bar_range=True)
 
 # ----------------------------- Lógica de Trading -----------------------------
 
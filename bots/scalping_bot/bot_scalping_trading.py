@@ -10,6 +10,14 @@ from dotenv import load_dotenv
 import sys
 import keyboard
 
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from utilities.scheduler import Scheduler
+from utilities.candle_store import fetch_closed_ohlcv
+from utilities.build_features import closed_features
+from utilities.feature_graph import FeaturePlan
+
 # ----------------------------- Utilidades -----------------------------
 
 def ts():
@@ -64,6 +72,7 @@ LEVERAGE = int(os.getenv("LEVERAGE", "5"))
 ATR_K = float(os.getenv("ATR_K", "1.5"))
 
 DATA_LIMIT = max(SMA_TREND, MACD_SLOW) + 50
+# Entre cierres de vela, cada cuánto se vigila una posición abierta (stop, TP, cierre manual)
 LOOP_SLEEP_SEC = 10
 CLOSE_FILE = 'close_order.txt'
 
@@ -104,56 +113,19 @@ exchange = make_exchange()
 
 # ----------------------------- Data & Indicadores -----------------------------
 
-def fetch_ohlcv_df(symbol: str, timeframe: str, limit: int) -> pd.DataFrame:
-    ohlcv = exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
-    df = pd.DataFrame(ohlcv, columns=["timestamp","open","high","low","close","volume"])
-    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-    return df
-
-def sma(series: pd.Series, period: int) -> pd.Series:
-    return series.rolling(window=period, min_periods=period).mean()
-
-def rsi(series: pd.Series, period: int = 14) -> pd.Series:
-    delta = series.diff()
-    up = np.where(delta > 0, delta, 0.0)
-    down = np.where(delta < 0, -delta, 0.0)
-    roll_up = pd.Series(up).rolling(period).mean()
-    roll_down = pd.Series(down).rolling(period).mean()
-    rs = roll_up / (roll_down + 1e-12)
-    rsi = 100.0 - (100.0 / (1.0 + rs))
-    rsi.index = series.index
-    return rsi
-
-def atr(df: pd.DataFrame, period: int = 14) -> pd.Series:
-    high = df['high']
-    low = df['low']
-    close = df['close']
-    prev_close = close.shift(1)
-    tr = pd.concat([
-        high - low,
-        (high - prev_close).abs(),
-        (low - prev_close).abs()
-    ], axis=1).max(axis=1)
-    return tr.rolling(period).mean()
-
-def macd(series: pd.Series, fast: int, slow: int, signal: int):
-    exp1 = series.ewm(span=fast, adjust=False).mean()
-    exp2 = series.ewm(span=slow, adjust=False).mean()
-    macd_line = exp1 - exp2
-    signal_line = macd_line.ewm(span=signal, adjust=False).mean()
-    hist = macd_line - signal_line
-    return macd_line, signal_line, hist
+def fetch_ohlcv_df(symbol: str, timeframe: str, limit: int):
+    """Devuelve (velas cerradas, vela en curso o None); solo se piden al exchange las velas nuevas."""
+    return fetch_closed_ohlcv(exchange, symbol, timeframe, limit)
 
 # ----------------------------- Estrategia de Trading (Long & Short) -----------------------------
 
-def build_features(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df['sma_fast'] = sma(df['close'], SMA_FAST)
-    df['sma_trend'] = sma(df['close'], SMA_TREND)
-    df['rsi'] = rsi(df['close'], RSI_PERIOD)
-    df['atr'] = atr(df, ATR_PERIOD)
-    df['macd'], df['macd_signal'], df['macd_hist'] = macd(df['close'], MACD_FAST, MACD_SLOW, MACD_SIGNAL)
-    return df
+# Indicadores que usa la estrategia: tendencia y ATR de la última vela, cruce del MACD en las dos últimas
+FEATURES = FeaturePlan({
+    'sma_trend': ('sma', SMA_TREND),
+    'atr': ('atr', ATR_PERIOD, True),
+    'macd': ('macd', MACD_FAST, MACD_SLOW, MACD_SIGNAL),
+    'macd_signal': ('macd_signal', MACD_FAST, MACD_SLOW, MACD_SIGNAL),
+}, rows={'sma_trend': 1, 'atr': 1, 'macd': 2, 'macd_signal': 2})
 
 class Position:
     def __init__(self):
@@ -338,13 +310,13 @@ def maybe_open_position(df: pd.DataFrame, capital: float):
                 print(f"{ts()} | ERROR OPEN SHORT ORDER: {e}")
 
 
-def maybe_manage_position(df: pd.DataFrame):
+def maybe_manage_position(df: pd.DataFrame, live: dict = None):
     global position
     if position.side is None:
         return None
     
-    last = df.iloc[-1]
-    price = float(last['close'])
+    # Stops y TP se comparan con el precio actual (vela en curso)
+    price = float(live['close']) if live else float(df.iloc[-1]['close'])
     exit_reason = None
     
     if os.path.exists(CLOSE_FILE):
@@ -466,8 +438,8 @@ def main_loop():
                     position.size = abs(float(active_position['contracts']))
                     print(f"{ts()} | Posición encontrada en la API: {position.side.upper()} @ {position.entry:.2f}")
 
-                    df = fetch_ohlcv_df(SYMBOL, TIMEFRAME, ATR_PERIOD)
-                    df = build_features(df)
+                    df, _ = fetch_ohlcv_df(SYMBOL, TIMEFRAME, ATR_PERIOD)
+                    df = FEATURES(df)
                     last = df.iloc[-1]
                     if position.side == 'long':
                         position.stop = position.entry - ATR_K * last['atr']
@@ -496,32 +468,34 @@ def main_loop():
     print(f"{ts()} | Modo de operación: {trade_mode.replace('_', ' ').upper()}")
     write_state(capital, trade_mode)
 
-    while True:
-        try:
-            df = fetch_ohlcv_df(SYMBOL, TIMEFRAME, DATA_LIMIT)
-            if len(df) < SMA_TREND or len(df) < MACD_SLOW:
-                print(f"{ts()} | Esperando más datos... (necesitas al menos {max(SMA_TREND, MACD_SLOW)} velas)")
-                time.sleep(LOOP_SLEEP_SEC)
-                continue
-            
-            df = build_features(df)
-            
-            maybe_open_position(df, capital)
-            
-            pnl = maybe_manage_position(df)
-            if pnl is not None:
-                capital += pnl
-                write_state(capital, trade_mode)
-                print(f"{ts()} | Capital actualizado (paper): {capital:.2f} {QUOTE}")
-                
-        except ccxt.RateLimitExceeded as e:
-            print(f"{ts()} | Rate limit excedido. Esperando...")
-            time.sleep(5)
-        except Exception as e:
-            print(f"{ts()} | ERROR LOOP: {e}")
-            time.sleep(LOOP_SLEEP_SEC)
-        finally:
-            time.sleep(LOOP_SLEEP_SEC)
+    def run_cycle():
+        nonlocal capital
+        df, live = fetch_ohlcv_df(SYMBOL, TIMEFRAME, DATA_LIMIT)
+        if len(df) < SMA_TREND or len(df) < MACD_SLOW:
+            print(f"{ts()} | Esperando más datos... (necesitas al menos {max(SMA_TREND, MACD_SLOW)} velas)")
+            return
+
+        # Señales sobre velas cerradas (indicadores en caché hasta la próxima vela)
+        df = closed_features((exchange.id, SYMBOL, TIMEFRAME), df, FEATURES)
+
+        maybe_open_position(df, capital)
+
+        pnl = maybe_manage_position(df, live)
+        if pnl is not None:
+            capital += pnl
+            write_state(capital, trade_mode)
+            print(f"{ts()} | Capital actualizado (paper): {capital:.2f} {QUOTE}")
+
+    def watch_position():
+        # Sin posición no hace falta consultar el exchange hasta el próximo cierre
+        if position.side is not None:
+            run_cycle()
+
+    # Entradas al cierre de cada vela; la posición abierta se vigila cada LOOP_SLEEP_SEC
+    scheduler = Scheduler(exchange)
+    scheduler.every(TIMEFRAME, run_cycle)
+    scheduler.every(LOOP_SLEEP_SEC, watch_position)
+    scheduler.run()
 
 if __name__ == "__main__":
     try:
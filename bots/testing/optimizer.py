@@ -2,6 +2,9 @@ import os
 import sys
 import time
 import math
+import heapq
+import itertools
+from multiprocessing import Pool
 from datetime import datetime
 import numpy as np
 import pandas as pd
@@ -13,7 +16,13 @@ from typing import Tuple
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 # Nota: Este script requiere el archivo 'combined_strategy.py' en la misma carpeta.
-from utilities.combined_strategy import get_combined_signal
+from utilities.combined_strategy import signal_components, apply_volatility_filter
+from utilities.backfill import backfill
+from utilities.candle_store import candle_store, to_dataframe
+from utilities.build_features import with_columns
+import utilities.indicators as ind
+import utilities.backtest as bt
+from utilities.shared_arrays import SharedArrays
 
 # ----------------------------- Utilidades -----------------------------
 
@@ -21,17 +30,6 @@ def ts():
     """Devuelve un string de la marca de tiempo UTC."""
     return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
 
-def timeframe_to_seconds(timeframe: str) -> int:
-    """Convierte un string de timeframe (ej. '1h', '4h') en segundos."""
-    if not timeframe: return 300
-    unit_map = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'M': 2592000}
-    try:
-        value = int(timeframe[:-1])
-        unit = timeframe[-1]
-        return value * unit_map[unit]
-    except (ValueError, IndexError):
-        return 300
-
 # ----------------------------- Configuración para Optimización ----------------------------
 
 # Carga las variables de entorno para la configuración del exchange
@@ -51,6 +49,16 @@ OPTIMIZATION_RANGES = {
     'MAX_VOLATILITY': np.arange(1.2, 2.1, 0.25)
 }
 
+# Periodos de indicadores a optimizar. Las SMAs y EMAs de todos los periodos se calculan de una
+# pasada (build_feature_sweep), así que añadir periodos apenas encarece los indicadores; cada
+# combinación sí añade sus backtests. Por defecto, los periodos fijos de abajo.
+# Ej.: 'SMA_TREND': [100, 150, 200], 'MACD_FAST': [8, 12], 'MACD_SLOW': [21, 26]
+INDICATOR_RANGES = {
+    'SMA_TREND': [200],
+    'MACD_FAST': [12],
+    'MACD_SLOW': [26],
+}
+
 # Parámetros de indicadores, pueden ser fijos durante la optimización
 ATR_PERIOD = 14
 RSI_PERIOD = 14
@@ -66,9 +74,25 @@ MACD_SIGNAL = 9
 # Configuración del backtest
 INITIAL_CAPITAL = 1000
 DATA_LIMIT = 800
+# Histórico largo (ej. '2020-01-01'): si se define, se descarga por páginas al almacén local
+# (reanudable si se interrumpe) y se optimiza sobre todo el histórico en lugar de DATA_LIMIT velas
+HISTORY_SINCE = os.getenv("HISTORY_SINCE", "")
 RISK_PER_TRADE = 0.01 # 1% de riesgo por operación
 EXCHANGE_FEE = 0.0004 # 0.04% para Binance Futures
 
+# Búsqueda en paralelo: procesos (por defecto uno por núcleo), combinaciones por tarea (bloque),
+# mejores resultados que se conservan y cada cuántas combinaciones se informa del progreso
+OPTIMIZER_WORKERS = int(os.getenv("OPTIMIZER_WORKERS", str(os.cpu_count() or 1)))
+GRID_BLOCK_SIZE = 256
+TOP_RESULTS = 5
+PROGRESS_EVERY = 500
+# Walk-forward (velas de cada ventana): se optimiza en WALK_FORWARD_TRAIN velas, se evalúa en las
+# WALK_FORWARD_TEST siguientes y se avanza WALK_FORWARD_TEST velas. 0 = optimización normal
+WALK_FORWARD_TRAIN = int(os.getenv("WALK_FORWARD_TRAIN", "0"))
+WALK_FORWARD_TEST = int(os.getenv("WALK_FORWARD_TEST", "0"))
+# Columnas que lee run_backtest, en el orden del bloque compartido
+BACKTEST_COLUMNS = ('close', 'high', 'low', 'ATR', 'SMA_TREND', 'MACD', 'MACD_SIGNAL', 'RSI', 'STOCH_RSI_K', 'STOCH_RSI_D')
+
 # ----------------------------- Funciones de Criptomonedas -----------------------------
 
 def fetch_ohlcv_df(exchange, symbol: str, timeframe: str, limit: int) -> pd.DataFrame:
@@ -82,143 +106,114 @@ def fetch_ohlcv_df(exchange, symbol: str, timeframe: str, limit: int) -> pd.Data
         print(f"Error al obtener datos para {symbol}: {e}")
         return pd.DataFrame()
 
-def calculate_rsi(df: pd.DataFrame, period: int) -> pd.Series:
-    """
-    Calcula el Índice de Fuerza Relativa (RSI) para una serie de precios de cierre.
-    Maneja la división por cero si no hay pérdidas en el período.
-    """
-    delta = df['close'].diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-
-    # Maneja la división por cero
-    rs = gain / loss
-    rsi = 100 - (100 / (1 + rs))
-    
-    rsi.loc[loss == 0] = 100
-    rsi.loc[gain == 0] = 0
-
-    return rsi
+def load_history_df(exchange, symbol: str, timeframe: str, since: str) -> pd.DataFrame:
+    """Completa el histórico local desde `since` (YYYY-MM-DD) y lo carga desde disco."""
+    since_ms = exchange.parse8601(f"{since}T00:00:00Z")
+    try:
+        backfill(exchange, symbol, timeframe, since_ms)
+    except Exception as e:
+        print(f"Error en el backfill de {symbol}: {e}. Se usa el histórico guardado hasta ahora.")
+    return to_dataframe(candle_store.columns(exchange.id, symbol, timeframe, since=since_ms))
 
-def calculate_stoch_rsi_series(rsi_series: pd.Series, period: int) -> Tuple[pd.Series, pd.Series]:
+def build_feature_sweep(df: pd.DataFrame, sma_trends, macd_fasts, macd_slows) -> dict:
     """
-    Calcula las series %K y %D del Stochastic RSI a partir de una serie RSI.
+    Indicadores para cada combinación de periodos: {(sma_trend, macd_fast, macd_slow): DataFrame}.
+    Las SMAs de tendencia y las EMAs del MACD de todos los periodos salen de una pasada
+    (ind.sma_sweep, ind.ema_sweep) y el resto de indicadores se calcula una sola vez.
     """
-    rsi_min = rsi_series.rolling(window=period).min()
-    rsi_max = rsi_series.rolling(window=period).max()
-    
-    k = 100 * ((rsi_series - rsi_min) / (rsi_max - rsi_min))
-    k.loc[rsi_max == rsi_min] = 50 # Manejar la división por cero
-    
-    d = k.rolling(window=period).mean()
+    if df.empty: return {}
 
-    return k, d
+    close = ind.as_array(df['close'])
+    rsi = ind.rsi(close, RSI_PERIOD)
+    stoch_rsi_k, stoch_rsi_d = ind.stoch_rsi(rsi, STOCH_RSI_PERIOD)
+    common = {
+        'SMA_FAST': ind.sma(close, SMA_FAST),
+        'ATR': ind.atr(df['high'], df['low'], close, ATR_PERIOD),
+        'RSI': rsi,
+        'STOCH_RSI_K': stoch_rsi_k,
+        'STOCH_RSI_D': stoch_rsi_d,
+    }
 
-def build_features(df: pd.DataFrame) -> pd.DataFrame:
-    """Calcula todos los indicadores técnicos y los añade al DataFrame."""
-    if df.empty: return df
-    
-    df['SMA_FAST'] = df['close'].rolling(window=SMA_FAST).mean()
-    df['SMA_TREND'] = df['close'].rolling(window=SMA_TREND).mean()
-    
-    ema_fast = df['close'].ewm(span=MACD_FAST, adjust=False).mean()
-    ema_slow = df['close'].ewm(span=MACD_SLOW, adjust=False).mean()
-    df['MACD'] = ema_fast - ema_slow
-    df['MACD_SIGNAL'] = df['MACD'].ewm(span=MACD_SIGNAL, adjust=False).mean()
-    
-    df['tr'] = np.maximum(np.maximum(df['high'] - df['low'], abs(df['high'] - df['close'].shift(1))), abs(df['low'] - df['close'].shift(1)))
-    df['ATR'] = df['tr'].rolling(window=ATR_PERIOD).mean()
-    
-    # Calcular y añadir RSI
-    df['RSI'] = calculate_rsi(df, RSI_PERIOD)
-    
-    # Calcular y añadir StochRSI
-    stoch_rsi_k, stoch_rsi_d = calculate_stoch_rsi_series(df['RSI'], STOCH_RSI_PERIOD)
-    df['STOCH_RSI_K'] = stoch_rsi_k
-    df['STOCH_RSI_D'] = stoch_rsi_d
+    smas = dict(zip(sma_trends, ind.sma_sweep(close, sma_trends)))
+    spans = sorted(set(macd_fasts) | set(macd_slows))
+    emas = dict(zip(spans, ind.ema_sweep(close, spans)))
+    pairs = [(fast, slow) for fast in macd_fasts for slow in macd_slows if fast < slow]
+    if not pairs: return {}
+    macd_lines = np.stack([emas[fast] - emas[slow] for fast, slow in pairs])
+    signal_lines = ind.ema(macd_lines, MACD_SIGNAL)
 
-    return df
+    features = {}
+    for sma_trend in sma_trends:
+        for i, (fast, slow) in enumerate(pairs):
+            features[(sma_trend, fast, slow)] = with_columns(df, {
+                **common,
+                'SMA_TREND': smas[sma_trend],
+                'MACD': macd_lines[i],
+                'MACD_SIGNAL': signal_lines[i],
+            })
+    return features
 
 # ----------------------------- Lógica de Backtest -----------------------------
 
-def run_backtest(df, atr_k: float, trail_r_multiple: float, min_volatility: float, max_volatility: float):
+def prepare_backtest(df_with_features, sma_trend: int = SMA_TREND) -> dict:
+    """
+    Parte del backtest que no depende de los parámetros de gestión: precios, ATR y componentes de la
+    señal de cada vela (una entrada de build_feature_sweep, o un dict de arrays con sus columnas).
+    Se calcula una vez por juego de indicadores y se reutiliza en toda la rejilla con simulate_backtest.
+    """
+    return {
+        'close': np.asarray(df_with_features['close']),
+        'high': np.asarray(df_with_features['high']),
+        'low': np.asarray(df_with_features['low']),
+        'atr': np.asarray(df_with_features['ATR']),
+        # Tiempos en ms para los registros de operaciones (índice de la vela si no hay timestamp)
+        'time': (df_with_features['timestamp'].to_numpy('datetime64[ms]').astype(np.int64)
+                 if 'timestamp' in df_with_features else None),
+        'components': signal_components(df_with_features),
+        # El bucle comienza una vez que todos los indicadores están listos
+        'start_index': max(sma_trend, max(INDICATOR_RANGES['MACD_SLOW']), ATR_PERIOD, RSI_PERIOD, STOCH_RSI_PERIOD) + 20,
+        'signals': {},
+    }
+
+def run_backtest(df_with_features, atr_k: float, trail_r_multiple: float, min_volatility: float, max_volatility: float,
+                 sma_trend: int = SMA_TREND):
     """
-    Ejecuta una simulación de backtest con los parámetros dados.
+    Ejecuta una simulación de backtest con los parámetros dados sobre los indicadores ya calculados
+    (una entrada de build_feature_sweep, o un dict de arrays con sus columnas).
     Devuelve la ganancia total, el número de operaciones ganadoras/perdedoras.
     """
-    capital = INITIAL_CAPITAL
-    long_position = False
-    short_position = False
-    entry_price = 0
-    trades = []
-    
-    # Calcula TODAS las características ANTES del bucle
-    df_with_features = build_features(df.copy())
-    
-    # El bucle comienza una vez que todos los indicadores están listos
-    start_index = max(SMA_TREND, MACD_SLOW, ATR_PERIOD, RSI_PERIOD, STOCH_RSI_PERIOD) + 20
-    
-    for i in range(start_index, len(df_with_features)):
-        # Pasamos el DataFrame completo para que la estrategia pueda acceder a los datos
-        current_data = df_with_features.iloc[:i]
-        
-        signal = get_combined_signal(current_data, min_volatility, max_volatility)
-        
-        if not long_position and not short_position:
-            # Lógica de entrada
-            if signal == 'BUY':
-                entry_price = current_data['close'].iloc[-1]
-                stop_loss_price = entry_price - (current_data['ATR'].iloc[-1] * atr_k)
-                trailing_stop = entry_price - (current_data['ATR'].iloc[-1] * trail_r_multiple)
-                long_position = True
-            elif signal == 'SELL':
-                entry_price = current_data['close'].iloc[-1]
-                stop_loss_price = entry_price + (current_data['ATR'].iloc[-1] * atr_k)
-                trailing_stop = entry_price + (current_data['ATR'].iloc[-1] * trail_r_multiple)
-                short_position = True
-        
-        if long_position:
-            current_low = current_data['low'].iloc[-1]
-            current_close = current_data['close'].iloc[-1]
-            
-            # Actualiza el trailing stop si el precio se mueve a nuestro favor
-            new_trailing_stop = current_close - (current_data['ATR'].iloc[-1] * trail_r_multiple)
-            if new_trailing_stop > trailing_stop:
-                trailing_stop = new_trailing_stop
-            
-            # Cierra la posición si el precio cae al stop fijo o al trailing stop
-            if current_low <= stop_loss_price or current_low <= trailing_stop:
-                exit_price = max(stop_loss_price, trailing_stop)
-                pnl_pct = (exit_price - entry_price) / entry_price - EXCHANGE_FEE * 2
-                trades.append(pnl_pct)
-                long_position = False
-            elif signal == 'SELL': # Cierre por señal contraria
-                exit_price = current_close
-                pnl_pct = (exit_price - entry_price) / entry_price - EXCHANGE_FEE * 2
-                trades.append(pnl_pct)
-                long_position = False
-        
-        elif short_position:
-            current_high = current_data['high'].iloc[-1]
-            current_close = current_data['close'].iloc[-1]
-            
-            # Actualiza el trailing stop si el precio se mueve a nuestro favor
-            new_trailing_stop = current_close + (current_data['ATR'].iloc[-1] * trail_r_multiple)
-            if new_trailing_stop < trailing_stop:
-                trailing_stop = new_trailing_stop
-            
-            # Cierra la posición si el precio sube al stop fijo o al trailing stop
-            if current_high >= stop_loss_price or current_high >= trailing_stop:
-                exit_price = min(stop_loss_price, trailing_stop)
-                pnl_pct = (entry_price - exit_price) / entry_price - EXCHANGE_FEE * 2
-                trades.append(pnl_pct)
-                short_position = False
-            elif signal == 'BUY': # Cierre por señal contraria
-                exit_price = current_close
-                pnl_pct = (entry_price - exit_price) / entry_price - EXCHANGE_FEE * 2
-                trades.append(pnl_pct)
-                short_position = False
-    
+    return simulate_backtest(prepare_backtest(df_with_features, sma_trend), atr_k, trail_r_multiple,
+                             min_volatility, max_volatility)
+
+def backtest_trades(prepared: dict, atr_k: float, trail_r_multiple: float, min_volatility: float,
+                    max_volatility: float, start: int = None, end: int = None) -> np.ndarray:
+    """
+    Operaciones cerradas (backtest.TRADE_DTYPE) de la simulación de run_backtest sobre un
+    prepare_backtest. Las señales de cada filtro de volatilidad se guardan en `prepared`, así que
+    solo se calculan una vez por (min_volatility, max_volatility).
+    Con `start`/`end` solo se opera con las velas [start, end) (las operaciones abiertas al final se descartan).
+    """
+    # Señal de cada vela (la que daría get_combined_signal con las velas hasta ella)
+    signals = prepared['signals'].get((min_volatility, max_volatility))
+    if signals is None:
+        signals = bt.signal_codes(apply_volatility_filter(prepared['components'], min_volatility, max_volatility)[0])
+        prepared['signals'][(min_volatility, max_volatility)] = signals
+    # En la vela i se conocen las velas hasta la i - 1 (como df_with_features.iloc[:i]): se decide
+    # con la vela anterior, desde start_index - 1 hasta la penúltima
+    first, last = prepared['start_index'] - 1, len(prepared['close']) - 1
+    return bt.run(prepared['high'], prepared['low'], prepared['close'], prepared['atr'], signals,
+                  atr_k, trail_r_multiple, EXCHANGE_FEE, time=prepared['time'],
+                  start=first if start is None else max(start, first), end=last if end is None else min(end, last))
+
+def simulate_backtest(prepared: dict, atr_k: float, trail_r_multiple: float, min_volatility: float,
+                      max_volatility: float, start: int = None, end: int = None):
+    """Resumen de backtest_trades: ganancia total, número de operaciones y tasa de acierto."""
+    return summarize_trades(backtest_trades(prepared, atr_k, trail_r_multiple, min_volatility, max_volatility,
+                                            start, end))
+
+def summarize_trades(trades: np.ndarray):
+    """Ganancia total, número de operaciones y tasa de acierto de unos registros de operaciones."""
+    trades = trades['pnl_pct'].tolist()
     if not trades:
         return 0, 0, 0
     
@@ -228,12 +223,211 @@ def run_backtest(df, atr_k: float, trail_r_multiple: float, min_volatility: floa
     
     return total_gain + total_loss, len(trades), win_rate
 
+# ----------------------------- Búsqueda en paralelo -----------------------------
+
+# Estado de cada proceso de la búsqueda: rejilla, ventanas y prepare_backtest (sobre vistas de la
+# memoria compartida) por combinación de periodos
+_worker = {}
+
+def _init_worker(spec, keys, windows, grid, top):
+    """Se conecta al bloque compartido y prepara una vez el backtest de cada combinación de periodos."""
+    shared = SharedArrays.attach(spec)
+    _worker.update(keys=keys, windows=windows, grid=grid, top=top)
+    block = shared.arrays['features']
+    _worker['shared'] = shared
+    _worker['prepared'] = [prepare_backtest(dict(zip(BACKTEST_COLUMNS, block[i])), key[0])
+                           for i, key in enumerate(keys)]
+
+def _keep_best(best: list, item: tuple, top: int):
+    """Añade `item` (retorno, -orden, ...) al montículo de mínimos `best` si está entre los `top` mejores."""
+    if len(best) < top:
+        heapq.heappush(best, item)
+    elif item[:2] > best[0][:2]:
+        heapq.heapreplace(best, item)
+
+def _backtest_block(task: tuple) -> tuple:
+    """
+    Un bloque de la rejilla: (ventana, índice de periodos, desde, hasta) -> (ventana, combinaciones
+    probadas, los `top` mejores del bloque como (retorno, -orden, parámetros, operaciones, acierto)).
+    """
+    window, k, first, last = task
+    grid = _worker['grid']
+    start, end = _worker['windows'][window]
+    prepared = _worker['prepared'][k]
+    # Orden de cada combinación en la rejilla completa (ventana, periodos, parámetros)
+    base = (window * len(_worker['keys']) + k) * len(grid)
+    best = []
+    for g in range(first, last):
+        atr_k, trail_r_multiple, min_volatility, max_volatility = grid[g]
+        total_return, total_trades, win_rate = simulate_backtest(prepared, atr_k, trail_r_multiple, min_volatility,
+                                                                 max_volatility, start, end)
+        _keep_best(best, (total_return, -(base + g), k, grid[g], total_trades, win_rate), _worker['top'])
+    return window, last - first, best
+
+def grid_search(feature_sets: dict, ranges: dict = OPTIMIZATION_RANGES, workers: int = OPTIMIZER_WORKERS,
+                top: int = TOP_RESULTS) -> list:
+    """
+    Prueba todas las combinaciones de `ranges` sobre cada juego de indicadores de `feature_sets`
+    ({(sma_trend, macd_fast, macd_slow): DataFrame}) repartidas entre `workers` procesos.
+    Los indicadores y la rejilla viajan una sola vez (memoria compartida / al crear el pool); cada
+    tarea es un bloque de combinaciones y devuelve solo sus mejores resultados. Solo se guardan los `top` mejores resultados (memoria acotada sea cual sea la rejilla).
+    Devuelve la lista de resultados ordenada por retorno total.
+    """
+    return grid_search_windows(feature_sets, [(None, None)], ranges, workers, top)[0]
+
+def grid_search_windows(feature_sets: dict, windows: list, ranges: dict = OPTIMIZATION_RANGES,
+                        workers: int = OPTIMIZER_WORKERS, top: int = TOP_RESULTS) -> list:
+    """
+    grid_search sobre varias ventanas de velas a la vez ([(start, end), ...], ver backtest_trades):
+    las rejillas de todas las ventanas se reparten en el mismo pool y sobre el mismo bloque
+    compartido. Devuelve, por ventana, la lista de sus `top` mejores resultados.
+    """
+    keys = list(feature_sets)
+    if not keys:
+        return [[] for _ in windows]
+    shared = SharedArrays.create({'features': np.stack([
+        np.stack([np.asarray(feature_sets[key][column], dtype=np.float64) for column in BACKTEST_COLUMNS])
+        for key in keys])})
+
+    grid = list(itertools.product(ranges['ATR_K'], ranges['TRAIL_R_MULTIPLE'],
+                                  ranges['MIN_VOLATILITY'], ranges['MAX_VOLATILITY']))
+    total = len(windows) * len(keys) * len(grid)
+    tasks = [(window, k, first, min(first + GRID_BLOCK_SIZE, len(grid)))
+             for window in range(len(windows)) for k in range(len(keys))
+             for first in range(0, len(grid), GRID_BLOCK_SIZE)]
+    # Montículo de mínimos por ventana con los `top` mejores: (retorno, -orden, ...); a igual
+    # retorno gana la combinación que va antes en la rejilla, como con el bucle secuencial
+    best = [[] for _ in windows]
+    pool = None
+    try:
+        if workers > 1:
+            pool = Pool(workers, initializer=_init_worker, initargs=(shared.spec, keys, windows, grid, top))
+            outputs = pool.imap_unordered(_backtest_block, tasks)
+        else:
+            _init_worker(shared.spec, keys, windows, grid, top)
+            outputs = map(_backtest_block, tasks)
+        done = reported = 0
+        for window, count, items in outputs:
+            for item in items:
+                _keep_best(best[window], item, top)
+            done += count
+            if done - reported >= PROGRESS_EVERY or done == total:
+                reported = done
+                print(f"{ts()} | Iteración {done}/{total}")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _worker.clear()
+        shared.unlink()
+
+    def result(item):
+        total_return, _, k, (atr_k, trail_r_multiple, min_volatility, max_volatility), total_trades, win_rate = item
+        key = keys[k]
+        return {
+            'sma_trend': key[0],
+            'macd_fast': key[1],
+            'macd_slow': key[2],
+            'atr_k': atr_k,
+            'trail_r_multiple': trail_r_multiple,
+            'min_volatility': min_volatility,
+            'max_volatility': max_volatility,
+            'total_return_pct': total_return,
+            'total_trades': total_trades,
+            'win_rate': win_rate
+        }
+
+    return [[result(item) for item in sorted(items, key=lambda item: item[:2], reverse=True)] for items in best]
+
+# ----------------------------- Walk-forward -----------------------------
+
+def walk_forward_windows(first: int, end: int, train_bars: int, test_bars: int) -> list:
+    """Ventanas [(entrenamiento, prueba), ...] de velas [start, end) entre `first` y `end`, avanzando test_bars."""
+    windows = []
+    start = first
+    while start + train_bars < end:
+        train = (start, start + train_bars)
+        windows.append((train, (train[1], min(train[1] + test_bars, end))))
+        start += test_bars
+    return windows
+
+def walk_forward(feature_sets: dict, train_bars: int, test_bars: int, ranges: dict = OPTIMIZATION_RANGES,
+                 workers: int = OPTIMIZER_WORKERS):
+    """
+    Optimiza en cada ventana de entrenamiento (todas en paralelo, grid_search_windows) y evalúa el
+    mejor resultado en la ventana de prueba siguiente. Los indicadores se calculan una sola vez sobre
+    todo el histórico y cada ventana solo acota las velas en las que se opera.
+    Devuelve (resumen por ventana, operaciones fuera de muestra encadenadas en orden).
+    """
+    prepared = {key: prepare_backtest(features, key[0]) for key, features in feature_sets.items()}
+    if not prepared:
+        return [], np.empty(0, dtype=bt.TRADE_DTYPE)
+    # Primera vela en la que todos los juegos de indicadores pueden operar
+    first = max(p['start_index'] for p in prepared.values()) - 1
+    end = len(next(iter(prepared.values()))['close']) - 1
+    windows = walk_forward_windows(first, end, train_bars, test_bars)
+    if not windows:
+        return [], np.empty(0, dtype=bt.TRADE_DTYPE)
+
+    best = grid_search_windows(feature_sets, [train for train, _ in windows], ranges, workers, top=1)
+    summary, trades = [], []
+    for (train, test), results in zip(windows, best):
+        if not results:
+            continue
+        params = results[0]
+        key = (params['sma_trend'], params['macd_fast'], params['macd_slow'])
+        window_trades = backtest_trades(prepared[key], params['atr_k'], params['trail_r_multiple'],
+                                        params['min_volatility'], params['max_volatility'], *test)
+        total_return, total_trades, win_rate = summarize_trades(window_trades)
+        summary.append({
+            'train': train,
+            'test': test,
+            'params': params,
+            'test_return_pct': total_return,
+            'test_trades': total_trades,
+            'test_win_rate': win_rate
+        })
+        trades.append(window_trades)
+    return summary, np.concatenate(trades) if trades else np.empty(0, dtype=bt.TRADE_DTYPE)
+
+def print_walk_forward(df: pd.DataFrame, summary: list, trades: np.ndarray):
+    """Imprime el resultado de walk_forward: parámetros y retorno de cada ventana y el total fuera de muestra."""
+    times = df['timestamp'].to_numpy('datetime64[ms]')
+    def when(bar):
+        return np.datetime_as_string(times[bar], unit='m').replace('T', ' ')
+
+    train, test = summary[0]['train'], summary[0]['test']
+    print("\n--- Walk-forward ---")
+    print(f"{SYMBOL} en {TIMEFRAME}: {len(summary)} ventana(s) de {train[1] - train[0]} velas de entrenamiento y {test[1] - test[0]} de prueba")
+    print("---------------------------------------")
+    for i, window in enumerate(summary):
+        params = window['params']
+        print(f"Ventana {i+1}: entrenamiento {when(window['train'][0])} -> {when(window['train'][1] - 1)}, "
+              f"prueba {when(window['test'][0])} -> {when(window['test'][1] - 1)}")
+        print(f"  > SMA_TREND: {params['sma_trend']}, MACD: {params['macd_fast']}/{params['macd_slow']}, "
+              f"ATR_K: {params['atr_k']:.2f}, TRAIL_R_MULTIPLE: {params['trail_r_multiple']:.2f}, "
+              f"MIN_VOL: {params['min_volatility']:.2f}, MAX_VOL: {params['max_volatility']:.2f}")
+        print(f"  > Entrenamiento: {params['total_return_pct'] * 100:.2f}% ({params['total_trades']} operaciones)")
+        print(f"  > Prueba: {window['test_return_pct'] * 100:.2f}% ({window['test_trades']} operaciones, "
+              f"{window['test_win_rate'] * 100:.2f}% ganadoras)")
+
+    total_return, total_trades, win_rate = summarize_trades(trades)
+    print("---------------------------------------")
+    print("Fuera de muestra (todas las ventanas de prueba encadenadas):")
+    print(f"  > Retorno Total: {total_return * 100:.2f}%")
+    print(f"  > Operaciones: {total_trades}")
+    print(f"  > Tasa de Ganancia: {win_rate * 100:.2f}%")
+    print("---------------------------------------")
+
 def main_optimization():
     """Bucle principal de optimización."""
     exchange = getattr(ccxt, EXCHANGE_ID)({'enableRateLimit': True})
     
     print(f"{ts()} | Descargando datos para {SYMBOL} en {TIMEFRAME}...")
-    df = fetch_ohlcv_df(exchange, symbol=SYMBOL, timeframe=TIMEFRAME, limit=DATA_LIMIT)
+    if HISTORY_SINCE:
+        df = load_history_df(exchange, SYMBOL, TIMEFRAME, HISTORY_SINCE)
+    else:
+        df = fetch_ohlcv_df(exchange, symbol=SYMBOL, timeframe=TIMEFRAME, limit=DATA_LIMIT)
     
     if df.empty or len(df) < DATA_LIMIT:
         print("Datos insuficientes para la optimización. Por favor, ajuste el DATA_LIMIT o el símbolo.")
@@ -241,40 +435,33 @@ def main_optimization():
 
     print(f"Datos descargados. Iniciando backtest para {len(df)} velas.")
 
-    results = []
-    total_iterations = len(OPTIMIZATION_RANGES['ATR_K']) * len(OPTIMIZATION_RANGES['TRAIL_R_MULTIPLE']) * \
-                       len(OPTIMIZATION_RANGES['MIN_VOLATILITY']) * len(OPTIMIZATION_RANGES['MAX_VOLATILITY'])
-    iteration_count = 0
-    
-    for atr_k in OPTIMIZATION_RANGES['ATR_K']:
-        for trail_r_multiple in OPTIMIZATION_RANGES['TRAIL_R_MULTIPLE']:
-            for min_volatility in OPTIMIZATION_RANGES['MIN_VOLATILITY']:
-                for max_volatility in OPTIMIZATION_RANGES['MAX_VOLATILITY']:
-                    iteration_count += 1
-                    print(f"Iteración {iteration_count}/{total_iterations}: ATR_K={atr_k:.1f}, TRAIL_R_MULTIPLE={trail_r_multiple:.1f}, MIN_VOL={min_volatility:.2f}, MAX_VOL={max_volatility:.2f}")
-                    
-                    total_return, total_trades, win_rate = run_backtest(df, atr_k, trail_r_multiple, min_volatility, max_volatility)
-                    
-                    results.append({
-                        'atr_k': atr_k,
-                        'trail_r_multiple': trail_r_multiple,
-                        'min_volatility': min_volatility,
-                        'max_volatility': max_volatility,
-                        'total_return_pct': total_return,
-                        'total_trades': total_trades,
-                        'win_rate': win_rate
-                    })
-
-    # Ordenar los resultados por ganancia total
-    results.sort(key=lambda x: x['total_return_pct'], reverse=True)
+    # Indicadores de todas las combinaciones de periodos, calculados antes del bucle
+    feature_sets = build_feature_sweep(df, INDICATOR_RANGES['SMA_TREND'], INDICATOR_RANGES['MACD_FAST'],
+                                       INDICATOR_RANGES['MACD_SLOW'])
+
+    if WALK_FORWARD_TRAIN > 0 and WALK_FORWARD_TEST > 0:
+        start = time.perf_counter()
+        summary, trades = walk_forward(feature_sets, WALK_FORWARD_TRAIN, WALK_FORWARD_TEST)
+        if not summary:
+            print("Histórico insuficiente para el walk-forward. Ajuste HISTORY_SINCE o el tamaño de las ventanas.")
+            return
+        print(f"{ts()} | Walk-forward completado en {time.perf_counter() - start:.1f}s con {max(OPTIMIZER_WORKERS, 1)} proceso(s).")
+        print_walk_forward(df, summary, trades)
+        return
+
+    start = time.perf_counter()
+    results = grid_search(feature_sets)
+    print(f"{ts()} | Búsqueda completada en {time.perf_counter() - start:.1f}s con {max(OPTIMIZER_WORKERS, 1)} proceso(s).")
 
     print("\n--- Resultados de la Optimización ---")
     print(f"Mejores parámetros para {SYMBOL} en {TIMEFRAME} (basado en retorno total):")
     print("---------------------------------------")
     
-    # Imprimir los 5 mejores resultados
-    for i, res in enumerate(results[:5]):
+    # Imprimir los mejores resultados
+    for i, res in enumerate(results):
         print(f"Rank {i+1}:")
+        print(f"  > SMA_TREND: {res['sma_trend']}")
+        print(f"  > MACD: {res['macd_fast']}/{res['macd_slow']}/{MACD_SIGNAL}")
         print(f"  > ATR_K: {res['atr_k']:.1f}")
         print(f"  > TRAIL_R_MULTIPLE: {res['trail_r_multiple']:.1f}")
         print(f"  > MIN_VOLATILITY: {res['min_volatility']:.2f}")
@@ -5,11 +5,24 @@ import time
 import math
 from dotenv import load_dotenv
 import utilities.cerebro
+from utilities.price_feed import PollingPriceFeed, BinanceWebSocketPriceFeed, ReplayPriceFeed
+from utilities.scheduler import Scheduler
 # Add project root to Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 # Cargar variables de entorno
 load_dotenv()
 
+# Fuente de precios para la vigilancia de posiciones: 'rest' (sondeo cada PRICE_POLL_SEC, como antes
+# del websocket: un fetch_tickers por sondeo), 'websocket' (tick a tick, sin sondeo) o 'replay'
+PRICE_FEED = os.getenv('PRICE_FEED', 'rest').lower()
+PRICE_REPLAY_FILE = os.getenv('PRICE_REPLAY_FILE', 'ticks.csv')
+PRICE_RECORD_FILE = os.getenv('PRICE_RECORD_FILE') or None
+PRICE_POLL_SEC = float(os.getenv('PRICE_POLL_SEC', 5))
+# Las entradas se evalúan solo al cierre de cada vela de este timeframe (cerebro opera en 1h):
+# tras una salida por trailing stop no se vuelve a entrar hasta el siguiente cierre, aunque la
+# señal de la vela cerrada siga activa (antes se reevaluaba en cada vuelta de 5 s)
+ENTRY_TIMEFRAME = '1h'
+
 # Inicialización
 exchange = ccxt.binance({
     'apiKey': os.getenv('API_KEY'),
@@ -359,13 +372,14 @@ def adjust_order_for_available_margin(exchange, symbol, cantidad_monedas, precio
         return cantidad_monedas, lev, f"error_adjust_margin:{e}"
 
 
-def open_position_simple(exchange, symbol, lado, margen_usdt):
+def open_position_simple(exchange, symbol, lado, margen_usdt, precio=None):
     """Abrir posición de forma simple: calcula qty desde margen_usdt y lev,
     aplica precision mínima y notional, verifica balance simple y ejecuta market order.
+    Si se pasa `precio` (snapshot del ciclo) no se vuelve a pedir el ticker.
     Retorna True si se envió la orden, False en caso contrario.
     """
     try:
-        precio = float(exchange.fetch_ticker(symbol)['last'])
+        precio = float(precio if precio is not None else exchange.fetch_ticker(symbol)['last'])
     except Exception as e:
         print(f"⚠️ open_position_simple: no se pudo obtener precio para {symbol}: {e}")
         return False
@@ -522,6 +536,34 @@ def close_position_simple(exchange, symbol):
         print(f"❌ close_position_simple fallo para {symbol}: {e}")
         return False
 
+def obtener_snapshot_precios(exchange, symbols):
+    """Un único fetch_tickers por ciclo para todos los símbolos.
+    Devuelve {symbol: último precio}; los símbolos sin precio no aparecen.
+    """
+    tickers = exchange.fetch_tickers(symbols)
+    precios = {}
+    for symbol in symbols:
+        ticker = tickers.get(symbol)
+        if ticker is None:
+            # El exchange puede devolver el símbolo unificado (ej. 'BTC/USDT:USDT')
+            try:
+                ticker = tickers.get(exchange.market(symbol)['symbol'])
+            except Exception:
+                ticker = None
+        precio = (ticker or {}).get('last') or (ticker or {}).get('close')
+        if precio:
+            precios[symbol] = float(precio)
+    return precios
+
+def crear_price_feed(lista_symbols):
+    """Crea la fuente de precios configurada en PRICE_FEED."""
+    if PRICE_FEED == 'websocket':
+        return BinanceWebSocketPriceFeed(lista_symbols, record_path=PRICE_RECORD_FILE)
+    if PRICE_FEED == 'replay':
+        return ReplayPriceFeed(PRICE_REPLAY_FILE)
+    return PollingPriceFeed(lambda symbols: obtener_snapshot_precios(exchange, symbols), lista_symbols,
+                            interval=PRICE_POLL_SEC, record_path=PRICE_RECORD_FILE)
+
 def ejecutar_bot():
     lista_symbols = [s.strip() for s in os.getenv('SYMBOLS').split(',')]#['BTC/USDT', 'ETH/USDT', 'SOL/USDT', 'ADA/USDT']    
     print("🚀 BOT 1H SNIPER - ISOLATED MARGIN 🚀")
@@ -533,38 +575,65 @@ def ejecutar_bot():
         configurar_margen_aislado(symbol)
         configurar_apalancamiento_maximo(symbol)
 
-    while True:
+    # Los precios llegan por la fuente configurada: las salidas se revisan en cada tick
+    # y las entradas al cierre de cada vela de ENTRY_TIMEFRAME con el último precio conocido.
+    feed = crear_price_feed(lista_symbols)
+    feed.start()
+    print(f"📡 Fuente de precios: {PRICE_FEED}")
+    precios = {}
+    # Símbolos cuyo escaneo de esta vela se saltó por no tener precio: se escanean al llegar su primer tick
+    pendientes = set()
+
+    def escanear_entradas(symbols=None):
         print(f"\n⏰ Escaneo {time.strftime('%H:%M:%S')} (Timeframe 1H)")
-        
-        for symbol in lista_symbols:
-            try:
-                ticker = exchange.fetch_ticker(symbol)
-                precio_actual = ticker['last']
 
-                # 1. ¿Tenemos que salir?
-                resultado = utilities.cerebro.monitorear_posicion(symbol, precio_actual)
-                if resultado['accion'] == 'CERRAR':
-                    ok = close_position_simple(exchange, symbol)
-                    if not ok:
-                        print(f"⚠️ No se ejecutó cierre simple para {symbol}")
+        for symbol in symbols or lista_symbols:
+            try:
+                precio_actual = precios.get(symbol)
+                if precio_actual is None:
+                    print(f"⚠️ Sin precio para {symbol} todavía, se escaneará al recibirlo")
+                    pendientes.add(symbol)
                     continue
+                pendientes.discard(symbol)
 
                 # 2. ¿Hay nueva entrada?
                 # Pasamos 'exchange' para que cerebro pueda bajar velas
                 senal = utilities.cerebro.consultar_senal_mercado(exchange, symbol)
                 
                 if senal['entrar']:
-                    ok = open_position_simple(exchange, symbol, senal['lado'], senal.get('cantidad_usdt', 0))
+                    ok = open_position_simple(exchange, symbol, senal['lado'], senal.get('cantidad_usdt', 0), precio=precio_actual)
                     if not ok:
                         print(f"⚠️ No se ejecutó entrada simple para {symbol}")
 
             except Exception as e:
                 print(f"⚠️ Error loop: {e}")
                 time.sleep(1)
-        
-        # En timeframe de 1H, no necesitamos escanear cada segundo si usamos cierre de vela,
-        # PERO como queremos salir "en cuanto retroceda", escaneamos rápido.
-        time.sleep(5) 
+
+    scheduler = Scheduler(exchange)
+    scheduler.every(ENTRY_TIMEFRAME, escanear_entradas)
+
+    try:
+        while not feed.closed:
+            # 1. ¿Tenemos que salir? (en cada tick)
+            for symbol, (precio_actual, _) in feed.wait(timeout=1).items():
+                precios[symbol] = precio_actual
+                try:
+                    resultado = utilities.cerebro.monitorear_posicion(symbol, precio_actual)
+                    if resultado['accion'] == 'CERRAR':
+                        ok = close_position_simple(exchange, symbol)
+                        if not ok:
+                            print(f"⚠️ No se ejecutó cierre simple para {symbol}")
+                except Exception as e:
+                    print(f"⚠️ Error monitoreando {symbol}: {e}")
+
+            # 2. Entradas: solo al cierre de vela (la primera vez, nada más arrancar), más los
+            # símbolos que se saltaron por no tener aún precio (p. ej. antes del primer mensaje del websocket)
+            scheduler.run_pending()
+            listos = [symbol for symbol in lista_symbols if symbol in pendientes and symbol in precios]
+            if listos:
+                escanear_entradas(listos)
+    finally:
+        feed.close()
 
 if __name__ == "__main__":
     ejecutar_bot()
\ No newline at end of file
@@ -0,0 +1,120 @@
+import os
+import time
+import asyncio
+from datetime import datetime
+import pandas as pd
+import ccxt.async_support as ccxt_async
+from dotenv import load_dotenv
+from utilities.candle_store import candle_store, to_dataframe, to_compact, split_closed, PAGE_LIMIT, MAX_CATCHUP_PAGES
+
+load_dotenv()
+
+# Máximo de peticiones simultáneas al exchange durante un escaneo
+SCAN_MAX_IN_FLIGHT = int(os.getenv("SCAN_MAX_IN_FLIGHT", "10"))
+
+def ts():
+    """Devuelve un string de la marca de tiempo UTC."""
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+class AsyncScanner:
+    """
+    Descarga las velas de todos los símbolos a la vez con el cliente async de ccxt
+    (como máximo `max_in_flight` peticiones en vuelo) y luego evalúa las señales en orden.
+    Las señales se evalúan sobre las velas cerradas; la vela en curso de cada símbolo queda en `live`.
+    Mantiene su propio event loop para poder usarse desde los bucles síncronos de los bots.
+    Con `compact` las velas se entregan como arrays COMPACT_CANDLE_DTYPE (float32) en lugar de DataFrames.
+    """
+
+    def __init__(self, exchange_id: str, config: dict = None, max_in_flight: int = SCAN_MAX_IN_FLIGHT,
+                 sandbox: bool = False, store=candle_store, compact: bool = False):
+        self.loop = asyncio.new_event_loop()
+        self.exchange = getattr(ccxt_async, exchange_id)(config or {'enableRateLimit': True})
+        if sandbox:
+            self.exchange.set_sandbox_mode(True)
+        self.max_in_flight = max_in_flight
+        self.store = store
+        self.compact = compact
+        self.live = {}
+
+    async def _fetch(self, semaphore, symbol: str, timeframe: str, limit: int):
+        """Igual que CandleStore.sync_closed, pero con peticiones async."""
+        exchange_id = self.exchange.id
+        window = limit + 1  # + la vela en curso, que se separa al final
+        async with semaphore:
+            # Misma decisión que CandleStore.sync: ventana completa si faltan velas guardadas o el hueco es grande
+            since = self.store.next_since(exchange_id, symbol, timeframe, window, self.exchange.milliseconds())
+            if since is None:
+                ohlcv = await self.exchange.fetch_ohlcv(symbol, timeframe, limit=window)
+                self.store.append(exchange_id, symbol, timeframe, ohlcv)
+            else:
+                for _ in range(MAX_CATCHUP_PAGES):
+                    page = await self.exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=PAGE_LIMIT)
+                    self.store.append(exchange_id, symbol, timeframe, page)
+                    if len(page) < PAGE_LIMIT:
+                        break
+                    since = int(page[-1][0])
+        closed, self.live[symbol] = split_closed(self.store.tail(exchange_id, symbol, timeframe, window),
+                                                 timeframe, self.exchange.milliseconds())
+        if self.compact:
+            return to_compact(closed[-limit:])
+        return to_dataframe(closed[-limit:])
+
+    async def _fetch_all(self, symbols, timeframe: str, limit: int):
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        tasks = [self._fetch(semaphore, symbol, timeframe, limit) for symbol in symbols]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    def fetch_all(self, symbols, timeframe: str, limit: int) -> dict:
+        """
+        Devuelve {símbolo: DataFrame de velas cerradas} para todos los símbolos.
+        Si la descarga de un símbolo falla, su valor es la excepción en lugar del DataFrame.
+        """
+        results = self.loop.run_until_complete(self._fetch_all(symbols, timeframe, limit))
+        return dict(zip(symbols, results))
+
+    def scan(self, symbols, timeframe: str, limit: int, evaluate, stop_on_signal: bool = False) -> dict:
+        """
+        Descarga todos los símbolos en paralelo y llama a `evaluate(symbol, df)` para cada uno, en orden.
+        Si la descarga de un símbolo falla se informa y se evalúa con un DataFrame vacío.
+        `evaluate` recibe DataFrames también en modo compacto.
+        Con `stop_on_signal` deja de evaluar en cuanto `evaluate` devuelve un valor verdadero.
+        """
+        start = time.perf_counter()
+        frames = self.fetch_all(symbols, timeframe, limit)
+        print(f"{ts()} | Velas de {len(symbols)} símbolos descargadas en {time.perf_counter() - start:.2f}s")
+
+        results = {}
+        for symbol, df in frames.items():
+            if isinstance(df, Exception):
+                print(f"{ts()} | Error al obtener datos para {symbol}: {df}")
+                df = pd.DataFrame()
+            elif self.compact:
+                df = to_dataframe(df)
+            results[symbol] = evaluate(symbol, df)
+            if stop_on_signal and results[symbol]:
+                break
+        return results
+
+    def scan_batch(self, symbols, timeframe: str, limit: int, evaluate_all):
+        """
+        Descarga todos los símbolos en paralelo y llama una sola vez a `evaluate_all({símbolo: df})`
+        con los que se descargaron bien, para calcular los indicadores de todos en bloque.
+        En modo compacto los valores son arrays de velas en float32 (ver stack_frames).
+        """
+        start = time.perf_counter()
+        frames = self.fetch_all(symbols, timeframe, limit)
+        print(f"{ts()} | Velas de {len(symbols)} símbolos descargadas en {time.perf_counter() - start:.2f}s")
+
+        for symbol, df in list(frames.items()):
+            if isinstance(df, Exception):
+                print(f"{ts()} | Error al obtener datos para {symbol}: {df}")
+                del frames[symbol]
+        return evaluate_all(frames)
+
+    def fetch_time(self) -> int:
+        """Hora del servidor del exchange en ms (para alinear el Scheduler)."""
+        return self.loop.run_until_complete(self.exchange.fetch_time())
+
+    def close(self):
+        self.loop.run_until_complete(self.exchange.close())
+        self.loop.close()
@@ -0,0 +1,78 @@
+import time
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import ccxt
+from utilities.candle_store import candle_store, timeframe_to_ms, PAGE_LIMIT
+
+MAX_WORKERS = 4
+MAX_RETRIES = 3
+
+def ts():
+    """Devuelve un string de la marca de tiempo UTC."""
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+class RequestSpacer:
+    """Espacia el inicio de las peticiones entre hilos para respetar el rate limit del exchange."""
+
+    def __init__(self, interval_sec: float):
+        self.interval = interval_sec
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+def _fetch_page(exchange, spacer, symbol, timeframe, since, page_limit):
+    """Descarga una página de velas desde `since`, reintentando ante errores de red."""
+    for attempt in range(MAX_RETRIES):
+        spacer.wait()
+        try:
+            return exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=page_limit)
+        except ccxt.NetworkError as e:
+            print(f"{ts()} | Error de red en página {since} de {symbol} (intento {attempt + 1}/{MAX_RETRIES}): {e}")
+            if attempt == MAX_RETRIES - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+def backfill(exchange, symbol: str, timeframe: str, since_ms: int, until_ms: int = None,
+             page_limit: int = PAGE_LIMIT, max_workers: int = MAX_WORKERS, store=candle_store) -> int:
+    """
+    Descarga el histórico de `symbol` desde `since_ms` por páginas (cursor `since`) y lo guarda en el almacén local.
+    Las páginas se piden en paralelo (hasta `max_workers`) pero se escriben en orden, así que si se interrumpe
+    basta con volver a llamarla: continúa desde la última vela guardada.
+    Devuelve el número de velas escritas.
+    """
+    exchange_id = exchange.id
+    tf_ms = timeframe_to_ms(timeframe)
+    if until_ms is None:
+        until_ms = exchange.milliseconds() if hasattr(exchange, 'milliseconds') else int(time.time() * 1000)
+
+    # Reanudar solo si el archivo ya empieza donde se pidió; si no, se reconstruye desde `since_ms`
+    first_ts = store.first_timestamp(exchange_id, symbol, timeframe)
+    last_ts = store.last_timestamp(exchange_id, symbol, timeframe)
+    start = last_ts if first_ts is not None and first_ts < since_ms + tf_ms else since_ms
+    if start != last_ts and first_ts is not None:
+        print(f"{ts()} | El histórico guardado de {symbol} no cubre el inicio pedido. Se reconstruye desde {since_ms}.")
+
+    page_span = page_limit * tf_ms
+    cursors = list(range(start, until_ms, page_span))
+    spacer = RequestSpacer(getattr(exchange, 'rateLimit', 0) / 1000)
+    written = 0
+
+    print(f"{ts()} | Backfill {symbol} {timeframe}: {len(cursors)} páginas desde {start}.")
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for i in range(0, len(cursors), max_workers):
+            batch = cursors[i:i + max_workers]
+            futures = [pool.submit(_fetch_page, exchange, spacer, symbol, timeframe, since, page_limit) for since in batch]
+            for since, future in zip(batch, futures):
+                page = [bar for bar in future.result() if since <= bar[0] < since + page_span]
+                written += store.append(exchange_id, symbol, timeframe, page)
+            print(f"{ts()} | Backfill {symbol}: {min(i + max_workers, len(cursors))}/{len(cursors)} páginas.")
+
+    return written
@@ -0,0 +1,102 @@
+import numpy as np
+
+# Registro de cada operación cerrada. Los tiempos son los de `time` (ms) o el índice de la vela si no se pasa
+TRADE_DTYPE = np.dtype([
+    ('entry_time', np.int64),
+    ('exit_time', np.int64),
+    ('side', np.int8),          # 1 largo, -1 corto
+    ('entry_price', np.float64),
+    ('exit_price', np.float64),
+    ('reason', np.int8),        # EXIT_*
+    ('pnl_pct', np.float64),
+])
+
+# Motivo del cierre
+EXIT_STOP = 1       # stop fijo (entrada -/+ ATR * atr_k)
+EXIT_TRAILING = 2   # trailing stop
+EXIT_SIGNAL = 3     # señal contraria
+
+# Señales: 1 compra, -1 venta, 0 nada
+BUY, SELL = 1, -1
+
+# Velas que se miran de una vez al buscar la salida de una operación (se dobla si no está en la ventana)
+_EXIT_WINDOW = 16
+
+def signal_codes(signals) -> np.ndarray:
+    """Convierte señales 'BUY'/'SELL'/'NEUTRAL' en códigos int8 (BUY, SELL, 0)."""
+    signals = np.asarray(signals)
+    return np.where(signals == 'BUY', BUY, np.where(signals == 'SELL', SELL, 0)).astype(np.int8)
+
+def _find_exit(side: int, entry: int, end: int, close, atr_trail, extreme, signal, stop_price: float, trailing: float):
+    """
+    Primera vela >= entry en la que se cierra la operación. El trailing stop de cada vela es el
+    máximo (largos) o mínimo (cortos) acumulado de close -/+ ATR * trail desde la entrada.
+    Devuelve (vela, precio, motivo) o None si sigue abierta al llegar a `end`.
+    """
+    start, window = entry, _EXIT_WINDOW
+    while start < end:
+        stop = min(start + window, end)
+        if side == BUY:
+            # fmax ignora los NaN igual que `nuevo > trailing` en un bucle
+            trail = np.fmax.accumulate(np.concatenate(([trailing], close[start:stop] - atr_trail[start:stop])))[1:]
+            hit = (extreme[start:stop] <= stop_price) | (extreme[start:stop] <= trail)
+            opposite = signal[start:stop] == SELL
+        else:
+            trail = np.fmin.accumulate(np.concatenate(([trailing], close[start:stop] + atr_trail[start:stop])))[1:]
+            hit = (extreme[start:stop] >= stop_price) | (extreme[start:stop] >= trail)
+            opposite = signal[start:stop] == BUY
+        exits = np.flatnonzero(hit | opposite)
+        if len(exits):
+            j = exits[0]
+            if hit[j]:
+                level = trail[j]
+                if side == BUY:
+                    return start + j, max(stop_price, level), EXIT_STOP if stop_price >= level else EXIT_TRAILING
+                return start + j, min(stop_price, level), EXIT_STOP if stop_price <= level else EXIT_TRAILING
+            return start + j, close[start + j], EXIT_SIGNAL
+        trailing = trail[-1]
+        start, window = stop, window * 2
+    return None
+
+def run(high, low, close, atr, signal, atr_k: float, trail_r_multiple: float, fee: float = 0.0,
+        time=None, start: int = 0, end: int = None) -> np.ndarray:
+    """
+    Backtest por eventos sobre arrays: en cada vela de [start, end) sin posición se entra al cierre
+    si hay señal (`signal` en códigos BUY/SELL) con stop fijo a ATR * atr_k y trailing a
+    ATR * trail_r_multiple; con posición se actualiza el trailing y se cierra si el mínimo/máximo
+    toca un stop (al precio del stop más cercano) o al cierre si llega la señal contraria.
+    Las velas sin posición ni señal se saltan y la salida de cada operación se busca en bloque.
+    `fee` se descuenta dos veces (entrada y salida). Devuelve las operaciones cerradas (TRADE_DTYPE).
+    """
+    close = np.asarray(close, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    atr = np.asarray(atr, dtype=np.float64)
+    signal = np.asarray(signal)
+    end = len(close) if end is None else min(end, len(close))
+    times = np.arange(len(close), dtype=np.int64) if time is None else np.asarray(time, dtype=np.int64)
+
+    entries = start + np.flatnonzero(signal[start:end])
+    # Cada operación empieza en una vela con señal distinta: no puede haber más
+    trades = np.empty(len(entries), dtype=TRADE_DTYPE)
+    count = 0
+    atr_trail = atr * trail_r_multiple
+
+    e = 0
+    while e < len(entries):
+        entry = entries[e]
+        side = int(signal[entry])
+        entry_price = close[entry]
+        stop_price = entry_price - side * atr[entry] * atr_k
+        trailing = entry_price - side * atr_trail[entry]
+        found = _find_exit(side, entry, end, close, atr_trail, low if side == BUY else high, signal,
+                           stop_price, trailing)
+        if found is None:
+            break
+        exit_bar, exit_price, reason = found
+        trades[count] = (times[entry], times[exit_bar], side, entry_price, exit_price, reason,
+                         side * (exit_price - entry_price) / entry_price - fee * 2)
+        count += 1
+        # Tras cerrar, la siguiente entrada posible es en la vela siguiente
+        e = np.searchsorted(entries, exit_bar + 1)
+    return trades[:count]
@@ -4,7 +4,10 @@ import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 from typing import Tuple
-from dotenv import load_dotenv
+from utilities.candle_store import fetch_ohlcv_cached, fetch_closed_ohlcv
+from utilities.cache import LRUCache
+import utilities.indicators as ind
+from utilities.streaming import FeatureStream
 
 load_dotenv()
 ATR_PERIOD = 14
@@ -18,74 +21,144 @@ MACD_FAST = 12
 MACD_SLOW = 26
 MACD_SIGNAL = 9
 
+# Modo compacto para escanear muchos símbolos: velas e indicadores en float32 (arrays estructurados)
+# y de cada indicador solo las últimas velas que lee la estrategia. Los cálculos se siguen haciendo
+# en float64; lo que se pierde es el redondeo de precios e indicadores a ~7 cifras significativas
+# (error relativo <= 6e-8). Solo cambian las comparaciones que se deciden por debajo de ese margen,
+# como un cruce MACD/señal con las dos líneas prácticamente iguales.
+COMPACT_FEATURES = os.getenv("COMPACT_FEATURES", "false").lower() == "true"
+COMPACT_DTYPE = np.float32
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    """Bytes que ocupa un DataFrame de indicadores (columnas e índice)."""
+    return int(df.memory_usage(index=True).sum())
+
+# Indicadores de velas cerradas ya calculados, por huella de la serie:
+# (builder o plan con sus parámetros, exchange, símbolo, timeframe, velas, última vela cerrada) -> DataFrame
+features_cache = LRUCache(maxsize=int(os.getenv("FEATURES_CACHE_SIZE", "64")),
+                          max_bytes=int(float(os.getenv("FEATURES_CACHE_MB", "64")) * 2**20), sizeof=frame_nbytes)
+# Indicadores incrementales por serie: (exchange, símbolo, timeframe) -> FeatureStream
+feature_streams = LRUCache(maxsize=int(os.getenv("FEATURES_CACHE_SIZE", "64")))
+
 def ts():
     """Devuelve un string de la marca de tiempo UTC."""
     return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
 
 def fetch_ohlcv_df(exchange, symbol: str, timeframe: str, limit: int) -> pd.DataFrame:
-    """Descarga datos OHLCV para el análisis."""
+    """Descarga datos OHLCV para el análisis (solo las velas nuevas, el resto sale del almacén local)."""
     try:
-        ohlcv = exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
-        df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        return df
+        return fetch_ohlcv_cached(exchange, symbol, timeframe, limit)
     except Exception as e:
         print(f"{ts()} | Error al obtener datos para {symbol}: {e}")
         return pd.DataFrame()
     
-def calculate_rsi(df: pd.DataFrame, period: int) -> pd.Series:
+def with_columns(df: pd.DataFrame, columns: dict) -> pd.DataFrame:
     """
-    Calcula el Índice de Fuerza Relativa (RSI) para una serie de precios de cierre.
-    Maneja la división por cero si no hay pérdidas en el período.
+    Devuelve un DataFrame nuevo con las columnas de `df` más `columns`, construido de una vez
+    (insertar columnas una a una en pandas cuesta más que calcular los indicadores).
     """
-    delta = df['close'].diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+    data = {name: df[name].to_numpy() for name in df.columns}
+    data.update(columns)
+    return pd.DataFrame(data, index=df.index)
 
-    # Maneja la división por cero
-    rs = gain / loss
-    rsi = 100 - (100 / (1 + rs))
-    
-    rsi.loc[loss == 0] = 100
-    rsi.loc[gain == 0] = 0
+def feature_arrays(high, low, close) -> dict:
+    """
+    Indicadores de build_features como arrays ({columna: array}). Con bloques 2-D
+    (símbolos x velas) calcula todos los símbolos en una sola pasada.
+    """
+    close = ind.as_array(close)
+    macd_line, signal_line, _ = ind.macd(close, MACD_FAST, MACD_SLOW, MACD_SIGNAL)
+    rsi = ind.rsi(close, RSI_PERIOD)
+    stoch_rsi_k, stoch_rsi_d = ind.stoch_rsi(rsi, STOCH_RSI_PERIOD)
+    return {
+        'SMA_FAST': ind.sma(close, SMA_FAST),
+        'SMA_TREND': ind.sma(close, SMA_TREND),
+        'MACD': macd_line,
+        'MACD_SIGNAL': signal_line,
+        'ATR': ind.atr(high, low, close, ATR_PERIOD),
+        'RSI': rsi,
+        'STOCH_RSI_K': stoch_rsi_k,
+        'STOCH_RSI_D': stoch_rsi_d,
+    }
 
-    return rsi
+def build_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Calcula todos los indicadores técnicos y devuelve el DataFrame con ellos."""
+    if df.empty: return df
+    return with_columns(df, feature_arrays(df['high'], df['low'], df['close']))
 
-def calculate_stoch_rsi_series(rsi_series: pd.Series, period: int) -> Tuple[pd.Series, pd.Series]:
+def stack_frames(frames: dict, length: int, columns=('high', 'low', 'close'), dtype=np.float64):
     """
-    Calcula las series %K y %D del Stochastic RSI a partir de una serie RSI.
+    Apila las últimas `length` velas de varios símbolos en bloques 2-D (símbolos x velas).
+    Los valores de `frames` pueden ser DataFrames o arrays de velas (también compactos).
+    Los símbolos con menos velas se omiten. Devuelve (símbolos, {columna: array N x length}).
     """
-    rsi_min = rsi_series.rolling(window=period).min()
-    rsi_max = rsi_series.rolling(window=period).max()
-    
-    k = 100 * ((rsi_series - rsi_min) / (rsi_max - rsi_min))
-    k.loc[rsi_max == rsi_min] = 50 # Manejar la división por cero
-    
-    d = k.rolling(window=period).mean()
+    symbols = [symbol for symbol, df in frames.items() if len(df) >= length]
+    arrays = {}
+    for name in columns:
+        block = np.empty((len(symbols), length), dtype=dtype)
+        for i, symbol in enumerate(symbols):
+            block[i] = np.asarray(frames[symbol][name])[-length:]
+        arrays[name] = block
+    return symbols, arrays
 
-    return k, d
+def group_frames(frames: dict, columns=('high', 'low', 'close'), dtype=np.float64):
+    """Como stack_frames, pero sin recortar: un bloque por cada número de velas distinto."""
+    lengths = sorted({len(df) for df in frames.values() if len(df)})
+    return [stack_frames({s: df for s, df in frames.items() if len(df) == n}, n, columns, dtype) for n in lengths]
 
-def build_features(df: pd.DataFrame) -> pd.DataFrame:
-    """Calcula todos los indicadores técnicos y los añade al DataFrame."""
-    if df.empty: return df
-    
-    df['SMA_FAST'] = df['close'].rolling(window=SMA_FAST).mean()
-    df['SMA_TREND'] = df['close'].rolling(window=SMA_TREND).mean()
-    
-    ema_fast = df['close'].ewm(span=MACD_FAST, adjust=False).mean()
-    ema_slow = df['close'].ewm(span=MACD_SLOW, adjust=False).mean()
-    df['MACD'] = ema_fast - ema_slow
-    df['MACD_SIGNAL'] = df['MACD'].ewm(span=MACD_SIGNAL, adjust=False).mean()
-    
-    df['tr'] = np.maximum(np.maximum(df['high'] - df['low'], abs(df['high'] - df['close'].shift(1))), abs(df['low'] - df['close'].shift(1)))
-    df['ATR'] = df['tr'].rolling(window=ATR_PERIOD).mean()
-    
-    # Calcular y añadir RSI
-    df['RSI'] = calculate_rsi(df, RSI_PERIOD)
-    
-    # Calcular y añadir StochRSI
-    stoch_rsi_k, stoch_rsi_d = calculate_stoch_rsi_series(df['RSI'], STOCH_RSI_PERIOD)
-    df['STOCH_RSI_K'] = stoch_rsi_k
-    df['STOCH_RSI_D'] = stoch_rsi_d
+def record_columns(records: np.ndarray) -> dict:
+    """Campos de un array estructurado como {columna: array} (vistas, sin copiar)."""
+    return {name: records[name] for name in records.dtype.names}
+
+def closed_features(key: tuple, closed: pd.DataFrame, builder=build_features) -> pd.DataFrame:
+    """
+    Indicadores de las velas cerradas, calculados una sola vez por vela: mientras no cierre otra
+    vela, repetir la evaluación cuesta una consulta a `features_cache`. `key` identifica la serie
+    (exchange, símbolo, timeframe); la caché se invalida sola cuando cierra una vela nueva porque
+    cambia el timestamp de la última. No modificar el resultado.
+    """
+    if closed.empty:
+        return closed
+    builder_key = getattr(builder, 'key', None) or (builder.__module__, builder.__name__)
+    cache_key = (builder_key, *key, len(closed), closed['timestamp'].iloc[-1])
+    features = features_cache.get(cache_key)
+    if features is None:
+        features = builder(closed.copy())
+        features_cache.put(cache_key, features)
+    return features
 
-    return df
\ No newline at end of file
+def new_feature_stream() -> FeatureStream:
+    """FeatureStream con los mismos periodos que build_features."""
+    return FeatureStream(SMA_FAST, SMA_TREND, (MACD_FAST, MACD_SLOW, MACD_SIGNAL), ATR_PERIOD, RSI_PERIOD, STOCH_RSI_PERIOD)
+
+def streamed_features(key: tuple, closed: pd.DataFrame) -> pd.DataFrame:
+    """
+    Igual que closed_features(key, closed, build_features), pero los indicadores avanzan de forma
+    incremental (O(1) por vela nueva) en lugar de recalcular toda la ventana. La primera vez, o si
+    la serie no continúa la anterior, se siembra de nuevo con `closed`. No modificar el resultado.
+    """
+    if closed.empty:
+        return closed
+    cache_key = ('stream', *key, len(closed), closed['timestamp'].iloc[-1])
+    features = features_cache.get(cache_key)
+    if features is None:
+        stream = feature_streams.get(key)
+        if stream is None or not stream.extend(closed):
+            stream = new_feature_stream()
+            stream.seed(closed)
+            feature_streams.put(key, stream)
+        features = with_columns(closed, stream.columns(len(closed)))
+        features_cache.put(cache_key, features)
+    return features
+
+def fetch_closed_features(exchange, symbol: str, timeframe: str, limit: int, builder=build_features):
+    """
+    Devuelve (indicadores de las últimas `limit` velas cerradas, vela en curso o None).
+    Entre dos cierres solo cambia la vela en curso: los indicadores salen de la caché.
+    """
+    try:
+        closed, live = fetch_closed_ohlcv(exchange, symbol, timeframe, limit)
+    except Exception as e:
+        print(f"{ts()} | Error al obtener datos para {symbol}: {e}")
+        return pd.DataFrame(), None
+    return closed_features((exchange.id, symbol, timeframe), closed, builder), live
@@ -0,0 +1,61 @@
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    Diccionario acotado en memoria. Al superar `maxsize` entradas (o `max_bytes` bytes,
+    medidos con `sizeof(valor)`) elimina la que lleva más tiempo sin usarse.
+    Cuenta aciertos y fallos de `get` en `hits` y `misses`.
+    """
+
+    def __init__(self, maxsize: int = 128, max_bytes: int = None, sizeof=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value):
+        self.pop(key)
+        size = self.sizeof(value) if self.sizeof else 0
+        self._data[key] = value
+        self._sizes[key] = size
+        self.nbytes += size
+        # La entrada recién añadida se conserva aunque supere por sí sola `max_bytes`
+        while len(self._data) > 1 and (len(self._data) > self.maxsize or
+                                       (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+            old, _ = self._data.popitem(last=False)
+            self.nbytes -= self._sizes.pop(old)
+
+    def pop(self, key, default=None):
+        if key not in self._data:
+            return default
+        self.nbytes -= self._sizes.pop(key)
+        return self._data.pop(key)
+
+    def clear(self):
+        self._data.clear()
+        self._sizes.clear()
+        self.nbytes = 0
+
+    def stats(self) -> dict:
+        """Aciertos, fallos, entradas y bytes ocupados."""
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self._data), 'bytes': self.nbytes}
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
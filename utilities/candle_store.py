@@ -0,0 +1,226 @@
+import os
+import time
+import calendar
+import pathlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from dotenv import load_dotenv
+from utilities.columnar import ColumnarCandleFile, COLUMNS
+
+load_dotenv()
+
+# Directorio donde se guardan las velas (una carpeta por exchange, un archivo columnar por símbolo/timeframe)
+CANDLE_STORE_DIR = os.getenv("CANDLE_STORE_DIR", str(pathlib.Path(__file__).parent.parent / 'data' / 'candles'))
+# Guardar OHLCV en float32 en los archivos nuevos (la mitad de espacio, ~7 dígitos significativos)
+CANDLE_STORE_FLOAT32 = os.getenv("CANDLE_STORE_FLOAT32", "false").lower() == "true"
+
+# Velas en memoria (las que devuelven tail/read); en disco se guardan por columnas
+CANDLE_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+# Velas en modo compacto (escaneo de muchos símbolos): OHLCV en float32, 28 bytes por vela en lugar de 48
+COMPACT_CANDLE_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('open', '<f4'),
+    ('high', '<f4'),
+    ('low', '<f4'),
+    ('close', '<f4'),
+    ('volume', '<f4'),
+])
+
+# Máximo de velas por petición cuando hay que ponerse al día
+PAGE_LIMIT = 1000
+MAX_CATCHUP_PAGES = 20
+# Las velas semanales de Binance abren el lunes; el epoch (1970-01-01) fue jueves
+WEEK_OFFSET_MS = 4 * 86400 * 1000
+
+def timeframe_to_ms(timeframe: str) -> int:
+    """Convierte un string de timeframe (ej. '1h', '4h') en milisegundos."""
+    unit_map = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'M': 2592000}
+    try:
+        return int(timeframe[:-1]) * unit_map[timeframe[-1]] * 1000
+    except (ValueError, IndexError, KeyError):
+        raise ValueError(f"Timeframe no soportado: {timeframe}")
+
+def candle_open_ms(timeframe: str, ts_ms: int) -> int:
+    """Timestamp (ms) de apertura de la vela de `timeframe` que contiene `ts_ms`."""
+    if timeframe.endswith('M'):
+        months = int(timeframe[:-1])
+        now = datetime.utcfromtimestamp(ts_ms / 1000)
+        index = (now.year - 1970) * 12 + now.month - 1
+        index = index // months * months
+        return calendar.timegm((1970 + index // 12, index % 12 + 1, 1, 0, 0, 0)) * 1000
+
+    tf_ms = timeframe_to_ms(timeframe)
+    offset = WEEK_OFFSET_MS if timeframe.endswith('w') else 0
+    return (ts_ms - offset) // tf_ms * tf_ms + offset
+
+def next_candle_close_ms(timeframe: str, now_ms: int) -> int:
+    """Timestamp (ms) del próximo cierre de vela de `timeframe` posterior a `now_ms`."""
+    if timeframe.endswith('M'):
+        # Meses de distinta duración: la vela siguiente abre justo después del último día de esta
+        start = candle_open_ms(timeframe, now_ms)
+        return candle_open_ms(timeframe, start + int(timeframe[:-1]) * 31 * 86400 * 1000)
+    return candle_open_ms(timeframe, now_ms) + timeframe_to_ms(timeframe)
+
+def to_dataframe(candles) -> pd.DataFrame:
+    """Convierte un array de velas (o un dict de columnas) en el DataFrame que usan los bots."""
+    df = pd.DataFrame({name: candles[name] for name in CANDLE_DTYPE.names})
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    return df
+
+def to_compact(candles) -> np.ndarray:
+    """Copia un array de velas (o un dict de columnas) en el formato compacto COMPACT_CANDLE_DTYPE."""
+    rows = np.empty(len(candles['timestamp']), dtype=COMPACT_CANDLE_DTYPE)
+    for name in COMPACT_CANDLE_DTYPE.names:
+        rows[name] = candles[name]
+    return rows
+
+def split_closed(candles, timeframe: str, now_ms: int):
+    """
+    Separa las velas cerradas de la vela que aún se está formando.
+    Devuelve (cerradas, en_curso): `cerradas` es el array de velas (de solo lectura, se puede cachear
+    por timestamp de la última vela) y `en_curso` un dict con la vela viva o None si no la hay.
+    """
+    timestamps = candles['timestamp']
+    live = None
+    # Cierre según el calendario (los meses no duran todos lo mismo)
+    if len(timestamps) and next_candle_close_ms(timeframe, int(timestamps[-1])) > now_ms:
+        live = {name: candles[name][-1].item() for name in CANDLE_DTYPE.names}
+        candles = candles[:-1]
+    if isinstance(candles, np.ndarray):
+        candles.flags.writeable = False
+    return candles, live
+
+class CandleStore:
+    """
+    Almacén local de velas OHLCV por (exchange, símbolo, timeframe).
+    Solo descarga las velas posteriores a la última guardada y sirve la ventana final desde disco.
+    """
+
+    def __init__(self, root: str = CANDLE_STORE_DIR, dtype=np.float64):
+        self.root = pathlib.Path(root)
+        self.dtype = dtype
+
+    def path(self, exchange_id: str, symbol: str, timeframe: str) -> pathlib.Path:
+        name = symbol.replace('/', '_').replace(':', '_')
+        return self.root / exchange_id / f"{name}_{timeframe}.ohlcv"
+
+    def _open(self, exchange_id: str, symbol: str, timeframe: str) -> ColumnarCandleFile:
+        path = self.path(exchange_id, symbol, timeframe)
+        legacy = path.with_suffix('.bin')
+        if not path.exists() and legacy.exists():
+            # Formato anterior (registros de ancho fijo): se convierte una sola vez
+            rows = np.fromfile(legacy, dtype=CANDLE_DTYPE)
+            ColumnarCandleFile(path, self.dtype).append(rows)
+            legacy.unlink()
+        return ColumnarCandleFile(path, self.dtype)
+
+    def count(self, exchange_id: str, symbol: str, timeframe: str) -> int:
+        return self._open(exchange_id, symbol, timeframe).count
+
+    def first_timestamp(self, exchange_id: str, symbol: str, timeframe: str):
+        """Devuelve el timestamp (ms) de la primera vela guardada o None."""
+        candles = self._open(exchange_id, symbol, timeframe)
+        return int(candles.column('timestamp', 0, 1)[0]) if candles.count else None
+
+    def last_timestamp(self, exchange_id: str, symbol: str, timeframe: str):
+        """Devuelve el timestamp (ms) de la última vela guardada o None."""
+        candles = self._open(exchange_id, symbol, timeframe)
+        return int(candles.column('timestamp', -1)[0]) if candles.count else None
+
+    def columns(self, exchange_id: str, symbol: str, timeframe: str, since: int = None, n: int = None) -> dict:
+        """
+        Columnas {nombre: array} de las velas guardadas desde `since` (ms) o de las últimas `n`,
+        como vistas memmap sin copia: cargar años de velas cuesta milisegundos.
+        """
+        candles = self._open(exchange_id, symbol, timeframe)
+        start = 0
+        if since is not None and candles.count:
+            start = int(np.searchsorted(candles.column('timestamp'), since, side='left'))
+        if n is not None:
+            start = max(start, candles.count - n)
+        return candles.columns(start)
+
+    def _to_rows(self, columns: dict) -> np.ndarray:
+        rows = np.empty(len(columns['timestamp']), dtype=CANDLE_DTYPE)
+        for name in COLUMNS:
+            rows[name] = columns[name]
+        return rows
+
+    def tail(self, exchange_id: str, symbol: str, timeframe: str, n: int) -> np.ndarray:
+        """Devuelve (copia en memoria) las últimas `n` velas guardadas."""
+        return self._to_rows(self.columns(exchange_id, symbol, timeframe, n=n if n > 0 else None))
+
+    def read(self, exchange_id: str, symbol: str, timeframe: str, since: int = None) -> np.ndarray:
+        """Devuelve (copia en memoria) todas las velas guardadas desde `since` (ms)."""
+        return self._to_rows(self.columns(exchange_id, symbol, timeframe, since=since))
+
+    def append(self, exchange_id: str, symbol: str, timeframe: str, ohlcv) -> int:
+        """
+        Añade velas ordenadas al archivo. Las velas guardadas con timestamp >= a la primera
+        vela nueva se sobrescriben (la última vela guardada suele ser la que aún se estaba formando).
+        Devuelve el número de velas escritas.
+        """
+        rows = np.array([tuple(bar[:6]) for bar in ohlcv], dtype=CANDLE_DTYPE)
+        return self._open(exchange_id, symbol, timeframe).append(rows)
+
+    def next_since(self, exchange_id: str, symbol: str, timeframe: str, limit: int, now: int):
+        """
+        Devuelve desde qué timestamp hay que pedir velas para ponerse al día, o None si conviene
+        descargar la ventana completa: hay menos de `limit` velas guardadas (p. ej. las guardó un bot
+        con una ventana más corta) o el hueco desde la última vela guardada es mayor que `limit`.
+        """
+        last_ts = self.last_timestamp(exchange_id, symbol, timeframe)
+        if last_ts is None or self.count(exchange_id, symbol, timeframe) < limit \
+                or (now - last_ts) // timeframe_to_ms(timeframe) >= limit:
+            return None
+        return last_ts
+
+    def sync(self, exchange, symbol: str, timeframe: str, limit: int) -> np.ndarray:
+        """
+        Pone al día el archivo local pidiendo solo las velas nuevas y devuelve las últimas `limit`.
+        Si hay menos de `limit` velas guardadas o el hueco desde la última es mayor que `limit`,
+        descarga la ventana completa.
+        """
+        exchange_id = exchange.id
+        now = exchange.milliseconds() if hasattr(exchange, 'milliseconds') else int(time.time() * 1000)
+        since = self.next_since(exchange_id, symbol, timeframe, limit, now)
+
+        if since is None:
+            self.append(exchange_id, symbol, timeframe, exchange.fetch_ohlcv(symbol, timeframe, limit=limit))
+        else:
+            for _ in range(MAX_CATCHUP_PAGES):
+                page = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=PAGE_LIMIT)
+                self.append(exchange_id, symbol, timeframe, page)
+                if len(page) < PAGE_LIMIT:
+                    break
+                since = int(page[-1][0])
+
+        return self.tail(exchange_id, symbol, timeframe, limit)
+
+    def sync_closed(self, exchange, symbol: str, timeframe: str, limit: int):
+        """Como `sync`, pero devuelve (últimas `limit` velas cerradas, vela en curso o None)."""
+        now = exchange.milliseconds() if hasattr(exchange, 'milliseconds') else int(time.time() * 1000)
+        closed, live = split_closed(self.sync(exchange, symbol, timeframe, limit + 1), timeframe, now)
+        return closed[-limit:], live
+
+candle_store = CandleStore(dtype=np.float32 if CANDLE_STORE_FLOAT32 else np.float64)
+
+def fetch_ohlcv_cached(exchange, symbol: str, timeframe: str, limit: int) -> pd.DataFrame:
+    """Equivalente a fetch_ohlcv + DataFrame, pero sirviendo la ventana desde el almacén local."""
+    return to_dataframe(candle_store.sync(exchange, symbol, timeframe, limit))
+
+def fetch_closed_ohlcv(exchange, symbol: str, timeframe: str, limit: int):
+    """
+    Devuelve (DataFrame con las últimas `limit` velas cerradas, vela en curso o None).
+    Las señales se calculan sobre las velas cerradas; la vela en curso solo aporta el precio actual.
+    """
+    closed, live = candle_store.sync_closed(exchange, symbol, timeframe, limit)
+    return to_dataframe(closed), live
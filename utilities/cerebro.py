@@ -1,8 +1,13 @@
 import pandas as pd
-import pandas_ta as ta
 import os
+import time
 from dotenv import load_dotenv
 import pathlib
+from utilities.cache import LRUCache
+from utilities.candle_store import next_candle_close_ms
+from utilities.resampler import Resampler
+from utilities.build_features import with_columns
+import utilities.indicators as ind
 
 # Obtener la ruta del archivo .env
 ruta_dotenv = pathlib.Path(__file__).parent.parent / '.env'
@@ -20,16 +25,88 @@ RSI_SOBREVENTA = 30
 RSI_SOBRECOMPRA = 70
 SMA_TENDENCIA = 200
 
+# Caché de velas e indicadores: la señal solo puede cambiar al cerrar una vela,
+# así que no se vuelve a descargar hasta que cierre la vela en curso.
+cache_velas = LRUCache(maxsize=int(os.getenv('CEREBRO_CACHE_SIZE', 64)))
+
+# Timeframe base (ej. '5m'): si se indica, las velas de 1h se derivan en memoria de un único flujo
+# base por símbolo guardado en el almacén local, en lugar de descargar la ventana completa
+CEREBRO_BASE_TIMEFRAME = os.getenv('CEREBRO_BASE_TIMEFRAME', '')
+resamplers = {}
+
+def _ahora_ms(exchange):
+    return exchange.milliseconds() if hasattr(exchange, 'milliseconds') else int(time.time() * 1000)
+
+def _entrada_cache(exchange, symbol, timeframe, limite):
+    """Devuelve la entrada de caché si la vela en curso aún no ha cerrado."""
+    entrada = cache_velas.get((getattr(exchange, 'id', ''), symbol, timeframe, limite))
+    if entrada is not None and _ahora_ms(exchange) < entrada['cierre']:
+        return entrada
+    return None
+
+def _velas_derivadas(exchange, symbol, timeframe, limite):
+    """Últimas `limite` velas de `timeframe` (la última en formación) derivadas del timeframe base."""
+    resampler = resamplers.get((timeframe, limite))
+    if resampler is None:
+        resampler = resamplers[(timeframe, limite)] = Resampler(CEREBRO_BASE_TIMEFRAME, {timeframe: limite})
+    resampler.sync(exchange, symbol)
+    return resampler.candles(symbol, timeframe, limite)
+
 def obtener_data_historica(exchange, symbol, timeframe='1h', limite=300):
     """Descarga velas reales de Binance para calcular indicadores"""
+    entrada = _entrada_cache(exchange, symbol, timeframe, limite)
+    if entrada is not None:
+        return entrada['df']
+
     try:
-        bars = exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limite)
-        df = pd.DataFrame(bars, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        return df
+        if CEREBRO_BASE_TIMEFRAME:
+            df = pd.DataFrame(_velas_derivadas(exchange, symbol, timeframe, limite))
+        else:
+            bars = exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limite)
+            df = pd.DataFrame(bars, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
     except Exception as e:
         print(f"Error descargando data: {e}")
         return None
 
+    if not df.empty:
+        cache_velas.put((getattr(exchange, 'id', ''), symbol, timeframe, limite), {
+            'df': df,
+            'cierre': next_candle_close_ms(timeframe, int(df['timestamp'].iloc[-1])),
+            'indicadores': None,
+        })
+    return df
+
+def calcular_indicadores(df):
+    """
+    Añade SMA200, RSI y MACD al DataFrame de velas, con los mismos valores y nombres de
+    columna que pandas_ta (RSI con medias de Wilder, EMAs que arrancan en una media simple).
+    """
+    close = ind.as_array(df['close'])
+    macd, signal, hist = ind.macd(close, 12, 26, 9, sma_seed=True)
+    return with_columns(df, {
+        # 1. Tendencia (SMA 200)
+        'sma200': ind.sma(close, SMA_TENDENCIA),
+        # 2. Momento (RSI 14)
+        'rsi': ind.rsi(close, 14, wilder=True),
+        # 3. Confirmación (MACD)
+        'MACD_12_26_9': macd,
+        'MACDh_12_26_9': hist,
+        'MACDs_12_26_9': signal,
+    })
+
+def obtener_indicadores(exchange, symbol, timeframe='1h', limite=300):
+    """Velas con indicadores, calculados una sola vez por vela cerrada."""
+    df = obtener_data_historica(exchange, symbol, timeframe, limite)
+    if df is None or df.empty:
+        return None
+
+    entrada = _entrada_cache(exchange, symbol, timeframe, limite)
+    if entrada is None:
+        return calcular_indicadores(df)
+    if entrada['indicadores'] is None:
+        entrada['indicadores'] = calcular_indicadores(df)
+    return entrada['indicadores']
+
 def consultar_senal_mercado(exchange, symbol):
     """
     Analiza SMA, RSI y MACD en 1H.
@@ -39,19 +116,9 @@ def consultar_senal_mercado(exchange, symbol):
 
     print(f"   🧠 [Cerebro]: Calculando indicadores 1H para {symbol}...")
     
-    df = obtener_data_historica(exchange, symbol)
+    # --- CÁLCULO DE INDICADORES (en caché hasta el cierre de la vela) ---
+    df = obtener_indicadores(exchange, symbol)
     if df is None: return {'entrar': False}
-
-    # --- CÁLCULO DE INDICADORES ---
-    # 1. Tendencia (SMA 200)
-    df['sma200'] = ta.sma(df['close'], length=SMA_TENDENCIA)
-    
-    # 2. Momento (RSI 14)
-    df['rsi'] = ta.rsi(df['close'], length=14)
-    
-    # 3. Confirmación (MACD)
-    macd = ta.macd(df['close'])
-    df = pd.concat([df, macd], axis=1) # Unir columnas MACD
     
     # Tomamos la última vela cerrada (penúltima en la lista) para confirmar señal
     last = df.iloc[-2] 
@@ -0,0 +1,151 @@
+import os
+import struct
+import pathlib
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Cabecera: magic, versión, bytes por valor OHLCV (8 = float64, 4 = float32), velas guardadas, capacidad
+MAGIC = b'OHLCVCOL'
+HEADER = struct.Struct('<8sHHqq')
+HEADER_SIZE = 64
+PRICE_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+COLUMNS = ('timestamp',) + PRICE_COLUMNS
+MIN_CAPACITY = 1024
+
+class ColumnarCandleFile:
+    """
+    Archivo columnar de velas: una columna int64 de timestamps y cinco columnas float64
+    (o float32) de OHLCV, cada una contigua y con capacidad reservada para poder añadir
+    velas sin reescribir el archivo. Se lee con numpy.memmap, así que cualquier ventana
+    es una vista sin copia.
+
+    Varios procesos pueden compartir el archivo: las escrituras toman un bloqueo exclusivo
+    (archivo `.lock` al lado) y las lecturas vuelven a leer la cabecera, porque al crecer
+    el archivo se reemplaza y cambian los offsets de las columnas.
+    """
+
+    def __init__(self, path, dtype=np.float64):
+        self.path = pathlib.Path(path)
+        self.dtype = np.dtype(dtype)
+        self.lock_path = self.path.with_suffix(self.path.suffix + '.lock')
+        self.count = 0
+        self.capacity = 0
+        if self.path.exists():
+            self._read_header()
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        """Bloqueo entre procesos (compartido para leer, exclusivo para escribir; en Windows siempre exclusivo)."""
+        with open(self.lock_path, 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _read_header(self):
+        with open(self.path, 'rb') as f:
+            magic, _, itemsize, count, capacity = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} no es un archivo de velas columnar")
+        self.dtype = np.dtype(np.float32 if itemsize == 4 else np.float64)
+        self.count = count
+        self.capacity = capacity
+
+    def _offset(self, name: str) -> int:
+        if name == 'timestamp':
+            return HEADER_SIZE
+        return HEADER_SIZE + self.capacity * 8 + PRICE_COLUMNS.index(name) * self.capacity * self.dtype.itemsize
+
+    def _column_dtype(self, name: str):
+        return np.dtype('<i8') if name == 'timestamp' else self.dtype.newbyteorder('<')
+
+    def _refresh(self):
+        """Relee la cabecera: otro proceso puede haber añadido velas o reemplazado el archivo al crecer."""
+        if self.path.exists():
+            self._read_header()
+
+    def column(self, name: str, start: int = 0, stop: int = None) -> np.ndarray:
+        """Vista de solo lectura (memmap) de una columna entre `start` y `stop`."""
+        if not self.path.exists():
+            return self._map(name, 0, 0)
+        with self._locked(exclusive=False):
+            self._refresh()
+            return self._map(name, start, stop)
+
+    def columns(self, start: int = 0, stop: int = None) -> dict:
+        """Todas las columnas de la ventana [start, stop) como vistas sin copia."""
+        if not self.path.exists():
+            return {name: self._map(name, 0, 0) for name in COLUMNS}
+        with self._locked(exclusive=False):
+            self._refresh()
+            return {name: self._map(name, start, stop) for name in COLUMNS}
+
+    def _map(self, name: str, start: int = 0, stop: int = None) -> np.ndarray:
+        """Como `column`, sin bloqueo ni releer la cabecera (para usar con el bloqueo ya tomado)."""
+        start, stop, _ = slice(start, stop).indices(self.count)
+        if stop <= start:
+            return np.empty(0, dtype=self._column_dtype(name))
+        dtype = self._column_dtype(name)
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=self._offset(name) + start * dtype.itemsize,
+                         shape=(stop - start,))
+
+    def _write_header(self, f):
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, 1, self.dtype.itemsize, self.count, self.capacity).ljust(HEADER_SIZE, b'\0'))
+
+    def _grow(self, needed: int):
+        """
+        Reescribe el archivo con más capacidad (se duplica, así que el coste se amortiza).
+        Se reemplaza de una vez: los memmap abiertos por otros procesos siguen viendo el archivo
+        anterior completo, y sus siguientes lecturas abren el nuevo.
+        """
+        old = {name: np.array(self._map(name)) for name in COLUMNS} if self.count else {}
+        self.capacity = max(needed, 2 * self.capacity, MIN_CAPACITY)
+        tmp = self.path.with_suffix(self.path.suffix + '.tmp')
+        with open(tmp, 'wb') as f:
+            self._write_header(f)
+            f.truncate(self._offset(PRICE_COLUMNS[-1]) + self.capacity * self.dtype.itemsize)
+            for name, values in old.items():
+                f.seek(self._offset(name))
+                f.write(values.astype(self._column_dtype(name)).tobytes())
+        os.replace(tmp, self.path)
+
+    def append(self, rows: np.ndarray) -> int:
+        """
+        Añade velas ordenadas (array estructurado con los campos de COLUMNS). Las velas guardadas
+        con timestamp >= a la primera vela nueva se sobrescriben. Devuelve el número de velas escritas.
+        """
+        if len(rows) == 0:
+            return 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Cabecera y velas se leen y escriben con el bloqueo tomado: otro proceso puede estar añadiendo
+        with self._locked(exclusive=True):
+            self._refresh()
+            keep = int(np.searchsorted(self._map('timestamp'), rows['timestamp'][0], side='left')) if self.count else 0
+            new_count = keep + len(rows)
+            if new_count > self.capacity:
+                self._grow(new_count)
+
+            with open(self.path, 'r+b') as f:
+                for name in COLUMNS:
+                    dtype = self._column_dtype(name)
+                    f.seek(self._offset(name) + keep * dtype.itemsize)
+                    f.write(np.ascontiguousarray(rows[name], dtype=dtype).tobytes())
+                self.count = new_count
+                self._write_header(f)
+        return len(rows)
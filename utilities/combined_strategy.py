@@ -1,5 +1,26 @@
+import numpy as np
 import pandas as pd
 from typing import Tuple
+from utilities.build_features import (ATR_PERIOD, RSI_PERIOD, STOCH_RSI_PERIOD, SMA_TREND,
+                                      MACD_FAST, MACD_SLOW, MACD_SIGNAL)
+from utilities.feature_graph import FeaturePlan
+
+# Velas de la media del ATR del filtro de volatilidad
+ATR_MEAN_WINDOW = 20
+# Puntuación mínima para dar señal
+SIGNAL_THRESHOLD = 3
+
+# Indicadores que lee la estrategia y cuántas de las últimas velas de cada uno (cruces: 2, media del ATR: 20)
+FEATURES = FeaturePlan({
+    'SMA_TREND': ('sma', SMA_TREND),
+    'MACD': ('macd', MACD_FAST, MACD_SLOW, MACD_SIGNAL),
+    'MACD_SIGNAL': ('macd_signal', MACD_FAST, MACD_SLOW, MACD_SIGNAL),
+    'RSI': ('rsi', RSI_PERIOD),
+    'STOCH_RSI_K': ('stoch_k', RSI_PERIOD, STOCH_RSI_PERIOD),
+    'STOCH_RSI_D': ('stoch_d', RSI_PERIOD, STOCH_RSI_PERIOD, STOCH_RSI_PERIOD),
+    'ATR': ('atr', ATR_PERIOD),
+}, rows={'SMA_TREND': 1, 'MACD': 2, 'MACD_SIGNAL': 2, 'RSI': 1, 'STOCH_RSI_K': 2, 'STOCH_RSI_D': 2,
+         'ATR': ATR_MEAN_WINDOW})
 
 def get_combined_signal(df: pd.DataFrame, min_volatility_multiplier: float, max_volatility_multiplier: float) -> Tuple[str, int]:
     """
@@ -36,7 +57,7 @@ def get_combined_signal(df: pd.DataFrame, min_volatility_multiplier: float, max_
     
     # Nuevo filtro de volatilidad
     current_atr = df['ATR'].iloc[-1]
-    atr_mean = df['ATR'].rolling(window=20).mean().iloc[-1]
+    atr_mean = df['ATR'].rolling(window=ATR_MEAN_WINDOW).mean().iloc[-1]
     atr_volatility_filter_pass = (current_atr > atr_mean * min_volatility_multiplier) and \
                                  (current_atr < atr_mean * max_volatility_multiplier)
 
@@ -77,9 +98,6 @@ def get_combined_signal(df: pd.DataFrame, min_volatility_multiplier: float, max_
     # Lógica para la señal final
     # -----------------------------
     
-    # Define los umbrales (puedes ajustar estos valores)
-    SIGNAL_THRESHOLD = 3
-    
     if buy_score >= SIGNAL_THRESHOLD:
         return 'BUY', buy_score
     elif sell_score >= SIGNAL_THRESHOLD:
@@ -87,3 +105,101 @@ def get_combined_signal(df: pd.DataFrame, min_volatility_multiplier: float, max_
     else:
         return 'NEUTRAL', 0
 
+def get_combined_signals(features: dict, min_volatility_multiplier: float, max_volatility_multiplier: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Misma señal que get_combined_signal para muchos símbolos a la vez. `features` tiene los
+    indicadores de FEATURES en bloques 2-D (símbolos x velas, al menos 200) más 'close'. Devuelve (señales, puntuaciones), un valor por símbolo.
+    """
+    close = features['close']
+    if close.shape[-1] < 200:
+        return np.full(len(close), 'NEUTRAL', dtype=object), np.zeros(len(close), dtype=int)
+
+    macd, macd_signal = features['MACD'], features['MACD_SIGNAL']
+    k, d = features['STOCH_RSI_K'], features['STOCH_RSI_D']
+    current_close = close[:, -1]
+    current_sma_trend = features['SMA_TREND'][:, -1]
+    current_rsi = features['RSI'][:, -1]
+    current_atr = features['ATR'][:, -1]
+    atr_mean = features['ATR'][:, -ATR_MEAN_WINDOW:].mean(axis=1)
+
+    macd_crossover_up = (macd[:, -2] < macd_signal[:, -2]) & (macd[:, -1] > macd_signal[:, -1])
+    macd_crossover_down = (macd[:, -2] > macd_signal[:, -2]) & (macd[:, -1] < macd_signal[:, -1])
+    stoch_rsi_crossover_up = (k[:, -1] > d[:, -1]) & (k[:, -2] < d[:, -2])
+    stoch_rsi_crossover_down = (k[:, -1] < d[:, -1]) & (k[:, -2] > d[:, -2])
+    atr_volatility_filter_pass = (current_atr > atr_mean * min_volatility_multiplier) & \
+                                 (current_atr < atr_mean * max_volatility_multiplier)
+
+    # Las condiciones de compra y venta de cada regla son excluyentes: basta con sumarlas
+    buy_score = ((current_close > current_sma_trend).astype(int) + macd_crossover_up + (current_rsi < 30)
+                 + (stoch_rsi_crossover_up & (k[:, -1] < 80)))
+    sell_score = ((current_close < current_sma_trend).astype(int) + macd_crossover_down + (current_rsi > 70)
+                  + (stoch_rsi_crossover_down & (k[:, -1] > 20)))
+
+    buy = atr_volatility_filter_pass & (buy_score >= SIGNAL_THRESHOLD)
+    sell = atr_volatility_filter_pass & ~buy & (sell_score >= SIGNAL_THRESHOLD)
+    signals = np.where(buy, 'BUY', np.where(sell, 'SELL', 'NEUTRAL')).astype(object)
+    scores = np.where(buy, buy_score, np.where(sell, sell_score, 0))
+    return signals, scores
+
+def signal_components(df) -> dict:
+    """
+    Parte de get_combined_signal_series que no depende de los multiplicadores de volatilidad:
+    puntuaciones de compra/venta de cada vela (0 antes de la vela 200), su ATR y la media del ATR.
+    Se calcula una vez por serie y se reutiliza con cualquier filtro (apply_volatility_filter).
+    `df` puede ser un DataFrame o un dict de arrays con las mismas columnas.
+    """
+    close = np.asarray(df['close'], dtype=float)
+    n = len(close)
+    macd, macd_signal = np.asarray(df['MACD'], dtype=float), np.asarray(df['MACD_SIGNAL'], dtype=float)
+    k, d = np.asarray(df['STOCH_RSI_K'], dtype=float), np.asarray(df['STOCH_RSI_D'], dtype=float)
+    sma_trend, rsi = np.asarray(df['SMA_TREND'], dtype=float), np.asarray(df['RSI'], dtype=float)
+    current_atr = np.asarray(df['ATR'], dtype=float)
+    # La media móvil de pandas de cada vela no depende de las posteriores: es la misma que la del prefijo
+    atr_mean = pd.Series(current_atr).rolling(window=ATR_MEAN_WINDOW).mean().to_numpy()
+
+    def previous(values):
+        out = np.empty_like(values)
+        out[:1] = np.nan
+        out[1:] = values[:-1]
+        return out
+
+    macd_prev, macd_signal_prev = previous(macd), previous(macd_signal)
+    k_prev, d_prev = previous(k), previous(d)
+
+    macd_crossover_up = (macd_prev < macd_signal_prev) & (macd > macd_signal)
+    macd_crossover_down = (macd_prev > macd_signal_prev) & (macd < macd_signal)
+    stoch_rsi_crossover_up = (k > d) & (k_prev < d_prev)
+    stoch_rsi_crossover_down = (k < d) & (k_prev > d_prev)
+
+    buy_score = ((close > sma_trend).astype(int) + macd_crossover_up + (rsi < 30)
+                 + (stoch_rsi_crossover_up & (k < 80)))
+    sell_score = ((close < sma_trend).astype(int) + macd_crossover_down + (rsi > 70)
+                  + (stoch_rsi_crossover_down & (k > 20)))
+
+    # Con menos de 200 velas get_combined_signal no da señal
+    warmup = np.arange(n) < 199
+    buy_score[warmup] = 0
+    sell_score[warmup] = 0
+    return {'buy_score': buy_score, 'sell_score': sell_score, 'atr': current_atr, 'atr_mean': atr_mean}
+
+def apply_volatility_filter(components: dict, min_volatility_multiplier: float, max_volatility_multiplier: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Señales y puntuaciones de cada vela a partir de signal_components y un filtro de volatilidad."""
+    current_atr, atr_mean = components['atr'], components['atr_mean']
+    buy_score, sell_score = components['buy_score'], components['sell_score']
+    atr_volatility_filter_pass = (current_atr > atr_mean * min_volatility_multiplier) & \
+                                 (current_atr < atr_mean * max_volatility_multiplier)
+
+    buy = atr_volatility_filter_pass & (buy_score >= SIGNAL_THRESHOLD)
+    sell = atr_volatility_filter_pass & ~buy & (sell_score >= SIGNAL_THRESHOLD)
+    signals = np.where(buy, 'BUY', np.where(sell, 'SELL', 'NEUTRAL')).astype(object)
+    scores = np.where(buy, buy_score, np.where(sell, sell_score, 0))
+    return signals, scores
+
+def get_combined_signal_series(df, min_volatility_multiplier: float, max_volatility_multiplier: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    get_combined_signal para todas las velas a la vez: el elemento i de (señales, puntuaciones) es
+    lo que devuelve get_combined_signal(df.iloc[:i + 1], ...). Una sola pasada vectorizada en lugar
+    de evaluar cada prefijo (los backtests pasan de cuadráticos a lineales). `df` puede ser un
+    DataFrame o un dict de arrays con las mismas columnas.
+    """
+    return apply_volatility_filter(signal_components(df), min_volatility_multiplier, max_volatility_multiplier)
@@ -0,0 +1,175 @@
+import numpy as np
+import utilities.indicators as ind
+from utilities.build_features import with_columns
+
+# Grafo de indicadores: cada nodo es una tupla (tipo, *parámetros), por ejemplo ('sma', 200) o
+# ('macd_signal', 12, 26, 9). Las entradas son 'high', 'low' y 'close'. Para cada tipo se conoce
+# de qué nodos depende y cuántas velas previas necesita cada valor (`warmup`); None significa
+# toda la historia (las EMAs son recursivas y su valor depende de dónde empiezan).
+
+INPUTS = ('high', 'low', 'close')
+# Símbolos por tanda en FeaturePlan.records: las copias float64 de las velas y los indicadores
+# intermedios solo existen para una tanda a la vez
+RECORDS_CHUNK = 64
+
+def _deps(node) -> tuple:
+    kind, args = node[0], node[1:]
+    if kind in ('sma', 'ema', 'rsi', 'macd_all'):
+        return ('close',)
+    if kind in ('macd', 'macd_signal', 'macd_hist'):
+        return (('macd_all',) + args,)
+    if kind == 'tr':
+        return ('high', 'low', 'close')
+    if kind == 'atr':
+        return (('tr',) + args[1:],)
+    if kind == 'stoch_k':
+        return (('rsi', args[0]),)
+    if kind == 'stoch_d':
+        return (('stoch_k',) + args[:2],)
+    raise ValueError(f"Indicador desconocido: {node}")
+
+def _warmup(node):
+    kind, args = node[0], node[1:]
+    if kind in ('ema', 'macd_all', 'macd', 'macd_signal', 'macd_hist'):
+        return None
+    if kind in ('sma', 'atr'):
+        return args[0] - 1
+    if kind == 'stoch_k':
+        return args[1] - 1
+    if kind == 'stoch_d':
+        return args[2] - 1
+    if kind == 'rsi':
+        return args[0]  # `period` variaciones reales necesitan period + 1 cierres
+    if kind == 'tr':
+        return 1
+    raise ValueError(f"Indicador desconocido: {node}")
+
+def _compute(node, values: dict):
+    kind, args = node[0], node[1:]
+    dep = [values[d] for d in _deps(node)]
+    if kind == 'sma':
+        return ind.sma(dep[0], args[0])
+    if kind == 'ema':
+        return ind.ema(dep[0], args[0])
+    if kind == 'macd_all':
+        return np.stack(ind.macd(dep[0], *args))  # línea, señal e histograma en el primer eje
+    if kind in ('macd', 'macd_signal', 'macd_hist'):
+        return dep[0][('macd', 'macd_signal', 'macd_hist').index(kind)]
+    if kind == 'tr':
+        return ind.true_range(*dep, first_bar_range=bool(args and args[0]))
+    if kind == 'atr':
+        return ind.sma(dep[0], args[0])
+    if kind == 'rsi':
+        return ind.rsi(dep[0], args[0])
+    if kind == 'stoch_k':
+        return ind.stoch_k(dep[0], args[1])
+    if kind == 'stoch_d':
+        return ind.sma(dep[0], args[2])
+
+def lookback(node, rows: int):
+    """Velas de entrada necesarias para calcular exactamente las últimas `rows` filas de `node` (None = todas)."""
+    if node in INPUTS:
+        return rows
+    warmup = _warmup(node)
+    if warmup is None:
+        return None
+    needed = [lookback(dep, rows + warmup) for dep in _deps(node)]
+    return None if None in needed else max(needed)
+
+def _evaluate(node, start: int, inputs: dict, memo: dict):
+    """Valores de `node` desde la vela `start`, reutilizando (recortados) los ya calculados en `memo`."""
+    if node in INPUTS:
+        return inputs[node][..., start:]
+    if node not in memo:
+        memo[node] = (start, _compute(node, {dep: _evaluate(dep, start, inputs, memo) for dep in _deps(node)}))
+    first, values = memo[node]
+    return values[..., start - first:]
+
+class FeaturePlan:
+    """
+    Indicadores que necesita una estrategia: {columna: nodo} y cuántas de las últimas filas lee de
+    cada columna (`rows`, un número para todas o un dict por columna; None = todas). Solo se calculan
+    esos nodos y cada uno sobre las velas mínimas para que esas filas salgan exactas:
+
+        plan = FeaturePlan({'sma_trend': ('sma', 200), 'macd': ('macd', 12, 26, 9)}, rows=2)
+        df = plan(df)          # columnas del plan; fuera de las filas pedidas quedan en NaN
+
+    Se puede usar como `builder` de closed_features y acepta bloques 2-D (símbolos x velas) en `arrays`.
+    """
+
+    def __init__(self, columns: dict, rows=1):
+        self.columns = dict(columns)
+        self.rows = dict(rows) if isinstance(rows, dict) else dict.fromkeys(self.columns, rows)
+        self.key = ('plan', tuple(self.columns.items()), tuple(sorted(self.rows.items())))
+        self._starts = {}
+
+    def starts(self, n: int) -> dict:
+        """{columna: (primera vela a calcular, filas pedidas)} para series de `n` velas."""
+        if n not in self._starts:
+            starts = {}
+            for name, node in self.columns.items():
+                rows = self.rows.get(name)
+                rows = n if rows is None else min(rows, n)
+                needed = lookback(node, rows)
+                starts[name] = (0 if needed is None else max(n - needed, 0), rows)
+            self._starts[n] = starts
+        return self._starts[n]
+
+    def _tails(self, high, low, close):
+        """Número de velas y {columna: sus últimas filas pedidas}."""
+        inputs = {'high': ind.as_array(high), 'low': ind.as_array(low), 'close': ind.as_array(close)}
+        n = inputs['close'].shape[-1]
+        # nodo -> (primera vela, valores). Las columnas se calculan de la que más historia pide a la
+        # que menos, así un nodo compartido se calcula una vez y al resto le basta un recorte.
+        memo = {}
+        tails = {}
+        for name, (start, rows) in sorted(self.starts(n).items(), key=lambda item: item[1][0]):
+            values = _evaluate(self.columns[name], start, inputs, memo)
+            tails[name] = values[..., values.shape[-1] - rows:]
+        return n, tails
+
+    @staticmethod
+    def _pad(values: np.ndarray, n: int, dtype) -> np.ndarray:
+        """Coloca `values` al final de una columna de `n` velas rellena con NaN."""
+        column = np.empty(values.shape[:-1] + (n,), dtype=dtype)
+        rows = values.shape[-1]
+        column[..., :n - rows] = np.nan
+        if rows:
+            column[..., n - rows:] = values
+        return column
+
+    def arrays(self, high, low, close) -> dict:
+        n, tails = self._tails(high, low, close)
+        return {name: self._pad(tails[name], n, np.float64) for name in self.columns}
+
+    def records(self, high, low, close, dtype=np.float32) -> np.ndarray:
+        """
+        Como `arrays`, pero en un array estructurado (un campo por columna, en `dtype`) que solo
+        guarda las últimas velas que se leen: las max(rows) finales. Las columnas que piden menos
+        filas quedan con NaN al principio. Se indexa igual que el dict de `arrays`
+        (records['MACD'][:, -1]). Los bloques 2-D se calculan por tandas de RECORDS_CHUNK símbolos,
+        así que la memoria en float64 no crece con el número de símbolos.
+        """
+        high, low, close = np.asarray(high), np.asarray(low), np.asarray(close)
+        if close.ndim < 2 or len(close) <= RECORDS_CHUNK:
+            return self._records(high, low, close, dtype)
+        width = max((rows for _, rows in self.starts(close.shape[-1]).values()), default=0)
+        out = np.empty(close.shape[:-1] + (width,), dtype=[(name, dtype) for name in self.columns])
+        for lo in range(0, len(close), RECORDS_CHUNK):
+            hi = lo + RECORDS_CHUNK
+            out[lo:hi] = self._records(high[lo:hi], low[lo:hi], close[lo:hi], dtype)
+        return out
+
+    def _records(self, high, low, close, dtype) -> np.ndarray:
+        n, tails = self._tails(high, low, close)
+        width = max((values.shape[-1] for values in tails.values()), default=0)
+        lead = next(iter(tails.values())).shape[:-1] if tails else ()
+        out = np.empty(lead + (width,), dtype=[(name, dtype) for name in self.columns])
+        for name in self.columns:
+            out[name] = self._pad(tails[name], width, dtype)
+        return out
+
+    def __call__(self, df):
+        if df.empty:
+            return df
+        return with_columns(df, self.arrays(df['high'], df['low'], df['close']))
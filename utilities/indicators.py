@@ -0,0 +1,253 @@
+from functools import lru_cache
+from typing import Tuple
+import numpy as np
+
+# Indicadores técnicos sobre arrays NumPy contiguos (float64), sin columnas temporales de pandas.
+# Mismas convenciones que las versiones con pandas que había en los bots: las primeras velas sin
+# datos suficientes quedan en NaN y las EMAs empiezan en el primer valor (ewm(adjust=False)).
+# Todos operan sobre el último eje: aceptan una serie (T) o un bloque de símbolos (N x T) a la vez.
+
+# Tamaño de bloque del filtro recursivo de las EMAs
+EMA_BLOCK = 64
+
+def as_array(values) -> np.ndarray:
+    """Convierte una Serie/lista en un array float64 contiguo (sin copiar si ya lo es)."""
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+def _first_valid(x: np.ndarray):
+    """
+    Índice del primer valor no NaN en el último eje (el largo si no hay ninguno).
+    Con varias filas devuelve None si no empiezan todas en el mismo índice.
+    """
+    if x.shape[-1] == 0 or not np.isnan(x[..., 0]).any():
+        return 0  # caso habitual: series sin huecos al principio
+    valid = ~np.isnan(x)
+    starts = np.where(valid.any(axis=-1), valid.argmax(axis=-1), x.shape[-1])
+    if starts.ndim == 0 or starts.size == 0:
+        return int(starts) if starts.ndim == 0 else x.shape[-1]
+    return int(starts.flat[0]) if (starts == starts.flat[0]).all() else None
+
+def sma(values, period: int) -> np.ndarray:
+    """Media móvil simple con sumas acumuladas: O(n) sea cual sea el periodo."""
+    x = as_array(values)
+    start = _first_valid(x)
+    if start is None:
+        return np.stack([sma(row, period) for row in x])
+    out = np.full(x.shape, np.nan)
+    v = x[..., start:]
+    if v.shape[-1] < period:
+        return out
+    # Restar el primer valor reduce el error de redondeo de la suma acumulada
+    base = v[..., :1]
+    c = np.zeros(v.shape[:-1] + (v.shape[-1] + 1,))
+    np.cumsum(v - base, axis=-1, out=c[..., 1:])
+    out[..., start + period - 1:] = (c[..., period:] - c[..., :-period]) / period + base
+    return out
+
+@lru_cache(maxsize=64)
+def _decay_matrix(alpha: float, block: int) -> np.ndarray:
+    """Matriz triangular L[i, j] = alpha * (1 - alpha) ** (i - j) para j <= i."""
+    lag = np.subtract.outer(np.arange(block), np.arange(block))
+    return np.where(lag >= 0, alpha * (1.0 - alpha) ** np.maximum(lag, 0), 0.0)
+
+def _recursive_filter(x: np.ndarray, alpha, initial) -> np.ndarray:
+    """
+    y[t] = alpha * x[t] + (1 - alpha) * y[t - 1], con y[-1] = initial.
+    Cada bloque de EMA_BLOCK valores se resuelve en forma cerrada con un producto de matrices
+    y solo el arrastre entre bloques es secuencial (len(x) / EMA_BLOCK pasos).
+    Con `alpha` un vector de P valores resuelve los P filtros a la vez (resultado P x ...).
+    """
+    alphas = np.atleast_1d(np.asarray(alpha, dtype=np.float64))
+    lead, n = x.shape[:-1], x.shape[-1]
+    ones = (1,) * len(lead)
+    block = min(EMA_BLOCK, n)
+    blocks = -(-n // block)
+    padded = np.zeros(lead + (blocks * block,))
+    padded[..., :n] = x
+    decay = np.stack([_decay_matrix(float(a), block).T for a in alphas]).reshape((len(alphas),) + ones + (block, block))
+    z = padded.reshape(lead + (blocks, block)) @ decay
+    carry_decay = ((1.0 - alphas)[:, None] ** np.arange(1, block + 1)).reshape((len(alphas),) + ones + (block,))
+    carry = np.broadcast_to(np.asarray(initial, dtype=np.float64), (len(alphas),) + lead)
+    for b in range(blocks):
+        row = z[..., b, :]
+        row += carry[..., None] * carry_decay
+        carry = row[..., -1]
+    out = z.reshape((len(alphas),) + lead + (-1,))[..., :n]
+    return out if np.ndim(alpha) else out[0]
+
+def ema(values, span: int = None, alpha: float = None, sma_seed: bool = False) -> np.ndarray:
+    """
+    EMA igual a pandas ewm(span, adjust=False): arranca en el primer valor válido.
+    Con `sma_seed` arranca en la media simple de las primeras `span` velas (como pandas_ta.ema).
+    """
+    x = as_array(values)
+    start = _first_valid(x)
+    if start is None:
+        return np.stack([ema(row, span, alpha, sma_seed) for row in x])
+    out = np.full(x.shape, np.nan)
+    alpha = alpha if alpha is not None else 2.0 / (span + 1.0)
+    if sma_seed:
+        seed_at = start + span - 1
+        if seed_at >= x.shape[-1]:
+            return out
+        out[..., seed_at] = x[..., start:seed_at + 1].mean(axis=-1)
+        if seed_at + 1 < x.shape[-1]:
+            out[..., seed_at + 1:] = _recursive_filter(x[..., seed_at + 1:], alpha, out[..., seed_at])
+    elif start < x.shape[-1]:
+        out[..., start:] = _recursive_filter(x[..., start:], alpha, x[..., start])
+    return out
+
+def rma(values, period: int) -> np.ndarray:
+    """
+    Media de Wilder como pandas ewm(alpha=1/period, min_periods=period).mean() (adjust=True),
+    que es la que usa pandas_ta: media ponderada normalizada desde el primer valor válido.
+    """
+    x = as_array(values)
+    start = _first_valid(x)
+    if start is None:
+        return np.stack([rma(row, period) for row in x])
+    out = np.full(x.shape, np.nan)
+    n = x.shape[-1] - start
+    if n >= period:
+        alpha = 1.0 / period
+        weighted = _recursive_filter(x[..., start:], alpha, np.zeros(x.shape[:-1]))
+        norm = 1.0 - (1.0 - alpha) ** np.arange(1, n + 1)
+        out[..., start + period - 1:] = (weighted / norm)[..., period - 1:]
+    return out
+
+def sma_sweep(values, periods) -> np.ndarray:
+    """
+    SMA de varios periodos a la vez: una sola suma acumulada para todos. Devuelve un array
+    (periodos x ...) cuya fila k es sma(values, periods[k]).
+    """
+    x = as_array(values)
+    start = _first_valid(x)
+    if start is None:
+        return np.stack([sma_sweep(row, periods) for row in x], axis=1)
+    out = np.full((len(periods),) + x.shape, np.nan)
+    v = x[..., start:]
+    base = v[..., :1]
+    c = np.zeros(v.shape[:-1] + (v.shape[-1] + 1,))
+    np.cumsum(v - base, axis=-1, out=c[..., 1:])
+    for k, period in enumerate(periods):
+        if v.shape[-1] >= period:
+            out[k, ..., start + period - 1:] = (c[..., period:] - c[..., :-period]) / period + base
+    return out
+
+def ema_sweep(values, spans) -> np.ndarray:
+    """
+    EMA (como ema) de varios spans a la vez: las recursiones se apilan y avanzan juntas.
+    Devuelve un array (spans x ...) cuya fila k es ema(values, spans[k]).
+    """
+    x = as_array(values)
+    start = _first_valid(x)
+    if start is None:
+        return np.stack([ema_sweep(row, spans) for row in x], axis=1)
+    out = np.full((len(spans),) + x.shape, np.nan)
+    if start < x.shape[-1]:
+        alphas = 2.0 / (np.asarray(spans, dtype=np.float64) + 1.0)
+        out[..., start:] = _recursive_filter(x[..., start:], alphas, x[..., start])
+    return out
+
+def macd(close, fast: int = 12, slow: int = 26, signal: int = 9,
+         sma_seed: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Devuelve (línea MACD, línea de señal, histograma). Con `sma_seed` las tres EMAs arrancan en
+    una media simple y la señal empieza en el primer valor válido de la línea (como pandas_ta.macd).
+    """
+    x = as_array(close)
+    line = ema(x, fast, sma_seed=sma_seed) - ema(x, slow, sma_seed=sma_seed)
+    signal_line = ema(line, signal, sma_seed=sma_seed)
+    return line, signal_line, line - signal_line
+
+def true_range(high, low, close, first_bar_range: bool = False) -> np.ndarray:
+    """
+    Rango verdadero. La primera vela no tiene cierre anterior: queda en NaN, o con
+    `first_bar_range=True` vale high - low (como pd.concat(...).max(axis=1)).
+    """
+    h, l, c = as_array(high), as_array(low), as_array(close)
+    tr = h - l
+    if c.shape[-1] > 1:
+        prev = c[..., :-1]
+        np.maximum(tr[..., 1:], np.abs(h[..., 1:] - prev), out=tr[..., 1:])
+        np.maximum(tr[..., 1:], np.abs(l[..., 1:] - prev), out=tr[..., 1:])
+    if tr.shape[-1] and not first_bar_range:
+        tr[..., 0] = np.nan
+    return tr
+
+def atr(high, low, close, period: int = 14, first_bar_range: bool = False) -> np.ndarray:
+    """ATR como media simple del rango verdadero."""
+    return sma(true_range(high, low, close, first_bar_range), period)
+
+def rsi(close, period: int = 14, wilder: bool = False) -> np.ndarray:
+    """
+    RSI con medias simples de subidas y bajadas (la versión que usan los bots).
+    Sin bajadas en la ventana vale 100 y sin subidas vale 0.
+    Con `wilder` usa medias de Wilder (rma) como pandas_ta.rsi; ahí sin movimiento queda NaN.
+    """
+    x = as_array(close)
+    out = np.full(x.shape, np.nan)
+    if x.shape[-1] < period:
+        return out
+    delta = np.empty(x.shape)
+    if wilder:
+        delta[..., 0] = np.nan  # como close.diff(): la primera vela no cuenta
+        np.subtract(x[..., 1:], x[..., :-1], out=delta[..., 1:])
+        gain = rma(np.maximum(delta, 0.0), period)
+        loss = rma(np.maximum(-delta, 0.0), period)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 100.0 * gain / (gain + loss)
+    delta[..., 0] = 0.0
+    np.subtract(x[..., 1:], x[..., :-1], out=delta[..., 1:])
+    gain = sma(np.maximum(delta, 0.0), period)
+    loss = sma(np.maximum(-delta, 0.0), period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = 100.0 - 100.0 / (1.0 + gain / loss)
+    out[loss == 0] = 100.0
+    out[gain == 0] = 0.0
+    return out
+
+def _rolling_extreme(values, period: int, func) -> np.ndarray:
+    """
+    Mínimo/máximo móvil de van Herk/Gil-Werman: se parte la serie en bloques de `period` velas y
+    cada ventana es el extremo entre el sufijo de un bloque y el prefijo del siguiente. Tres
+    pasadas vectorizadas sea cual sea `period`. Una ventana con NaN da NaN. Para ir vela a vela
+    está streaming.RollingExtreme (deque monótona).
+    """
+    x = as_array(values)
+    out = np.full(x.shape, np.nan)
+    lead, n = x.shape[:-1], x.shape[-1]
+    if n < period:
+        return out
+    blocks = -(-n // period)
+    padded = np.full(lead + (blocks * period,), np.inf if func is np.minimum else -np.inf)
+    padded[..., :n] = x
+    b = padded.reshape(lead + (blocks, period))
+    prefix = func.accumulate(b, axis=-1).reshape(lead + (-1,))
+    suffix = func.accumulate(b[..., ::-1], axis=-1)[..., ::-1].reshape(lead + (-1,))
+    out[..., period - 1:] = func(suffix[..., :n - period + 1], prefix[..., period - 1:n])
+    return out
+
+def rolling_min(values, period: int) -> np.ndarray:
+    return _rolling_extreme(values, period, np.minimum)
+
+def rolling_max(values, period: int) -> np.ndarray:
+    return _rolling_extreme(values, period, np.maximum)
+
+def stoch_k(rsi_values, period: int = 14) -> np.ndarray:
+    """%K del Stochastic RSI: posición del RSI en su rango de `period` velas (50 si no se movió)."""
+    r = as_array(rsi_values)
+    low = rolling_min(r, period)
+    high = rolling_max(r, period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = 100.0 * (r - low) / (high - low)
+    k[high == low] = 50.0
+    return k
+
+def stoch_rsi(rsi_values, period: int = 14, d_period: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    %K y %D del Stochastic RSI a partir de un RSI ya calculado. Si el RSI no se movió en la
+    ventana, %K vale 50. %D es la media de %K en `d_period` velas (por defecto `period`).
+    """
+    k = stoch_k(rsi_values, period)
+    return k, sma(k, d_period or period)
@@ -0,0 +1,183 @@
+import csv
+import json
+import time
+import asyncio
+import threading
+from datetime import datetime
+import aiohttp
+
+def ts():
+    """Devuelve un string de la marca de tiempo UTC."""
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+class PriceFeed:
+    """
+    Fuente de precios tipo push. Las implementaciones publican ticks con `publish` y el bot
+    los consume con `wait`, que devuelve los últimos precios recibidos desde la llamada anterior:
+    {symbol: (precio, timestamp_ms)}. Si hay varios ticks del mismo símbolo entre dos llamadas,
+    solo se entrega el último (el bot siempre decide con el precio más reciente).
+    Si se indica `record_path`, cada tick se guarda en CSV (timestamp,symbol,price) para poder reproducirlo.
+    """
+
+    def __init__(self, record_path: str = None):
+        self.closed = False
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._record = open(record_path, 'a', newline='', encoding='utf-8') if record_path else None
+        self._writer = csv.writer(self._record) if self._record else None
+
+    def start(self):
+        """Empieza a recibir precios."""
+
+    def publish(self, symbol: str, price: float, timestamp: int):
+        with self._lock:
+            self._pending[symbol] = (price, timestamp)
+            if self._writer:
+                self._writer.writerow([timestamp, symbol, price])
+        self._event.set()
+
+    def wait(self, timeout: float) -> dict:
+        """Espera hasta `timeout` segundos a que lleguen precios nuevos y los devuelve."""
+        self._event.wait(timeout)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._event.clear()
+        return pending
+
+    def close(self):
+        self.closed = True
+        self._event.set()
+        if self._record:
+            self._record.close()
+            self._record = None
+            self._writer = None
+
+class PollingPriceFeed(PriceFeed):
+    """Consulta los precios por REST cada `interval` segundos con `snapshot(symbols) -> {symbol: precio}`."""
+
+    def __init__(self, snapshot, symbols, interval: float = 5, record_path: str = None):
+        super().__init__(record_path)
+        self.snapshot = snapshot
+        self.symbols = symbols
+        self.interval = interval
+        self._next_poll = 0.0
+
+    def wait(self, timeout: float) -> dict:
+        delay = self._next_poll - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return {}
+        if delay > 0:
+            time.sleep(delay)
+        self._next_poll = time.monotonic() + self.interval
+        try:
+            now = int(time.time() * 1000)
+            for symbol, price in self.snapshot(self.symbols).items():
+                self.publish(symbol, price, now)
+        except Exception as e:
+            print(f"{ts()} | Error obteniendo precios: {e}")
+        return super().wait(0)
+
+class BinanceWebSocketPriceFeed(PriceFeed):
+    """
+    Precios en tiempo real desde los streams de Binance Futures. Por defecto `markPrice@1s`
+    (el precio que usa Binance para liquidaciones); con `stream='aggTrade'` llega cada operación.
+    Corre en un hilo propio con aiohttp y se reconecta automáticamente si se cae la conexión.
+    """
+
+    URL = 'wss://fstream.binance.com/stream?streams='
+
+    def __init__(self, symbols, stream: str = 'markPrice@1s', url: str = URL, record_path: str = None):
+        super().__init__(record_path)
+        # 'BTC/USDT:USDT' -> 'btcusdt'
+        self.ids = {s.split(':')[0].replace('/', '').upper(): s for s in symbols}
+        self.url = url + '/'.join(f"{market_id.lower()}@{stream}" for market_id in self.ids)
+        self._loop = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._listen())
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    async def _listen(self):
+        backoff = 1
+        while not self.closed:
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(self.url, heartbeat=30) as ws:
+                        print(f"{ts()} | WebSocket de precios conectado ({len(self.ids)} símbolos)")
+                        backoff = 1
+                        async for msg in ws:
+                            if msg.type != aiohttp.WSMsgType.TEXT:
+                                break
+                            data = json.loads(msg.data).get('data', {})
+                            symbol = self.ids.get(data.get('s'))
+                            price = data.get('p')
+                            if symbol and price is not None:
+                                self.publish(symbol, float(price), int(data.get('T') or data.get('E') or 0))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"{ts()} | WebSocket de precios desconectado: {e}. Reintentando en {backoff}s")
+            if not self.closed:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def close(self):
+        super().close()
+        if self._loop is not None and self._loop.is_running():
+            for task in asyncio.all_tasks(self._loop):
+                self._loop.call_soon_threadsafe(task.cancel)
+
+class ReplayPriceFeed(PriceFeed):
+    """
+    Reproduce ticks grabados en un CSV (timestamp,symbol,price) para probar la lógica de salida sin conexión.
+    Cada `wait` entrega los ticks de un mismo timestamp. Con `speed=0` va lo más rápido posible;
+    con `speed=1` respeta los tiempos originales. Al terminar el archivo marca `closed`.
+    """
+
+    def __init__(self, path: str, speed: float = 0):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self._rows = None
+        self._next = None
+        self._last_ts = None
+
+    def start(self):
+        self._file = open(self.path, newline='', encoding='utf-8')
+        self._rows = (row for row in csv.reader(self._file) if row and row[0].isdigit())
+        self._next = next(self._rows, None)
+
+    def wait(self, timeout: float) -> dict:
+        if self._next is None:
+            self.close()
+            return {}
+
+        timestamp = int(self._next[0])
+        if self.speed and self._last_ts is not None:
+            time.sleep(min(timeout, (timestamp - self._last_ts) / 1000 / self.speed))
+        self._last_ts = timestamp
+
+        ticks = {}
+        while self._next is not None and int(self._next[0]) == timestamp:
+            ticks[self._next[1]] = (float(self._next[2]), timestamp)
+            self._next = next(self._rows, None)
+        return ticks
+
+    def close(self):
+        super().close()
+        if self._rows is not None:
+            self._file.close()
+            self._rows = None
+            self._next = None
@@ -0,0 +1,153 @@
+from collections import deque
+import numpy as np
+from utilities.candle_store import candle_store, split_closed, CANDLE_DTYPE, timeframe_to_ms, candle_open_ms
+from utilities.backfill import backfill
+
+# Velas por timeframe que se guardan en memoria si no se indica otra ventana
+DEFAULT_WINDOW = 500
+
+class Resampler:
+    """
+    Deriva en memoria velas de timeframes superiores a partir de un único flujo base por símbolo
+    (por ejemplo 5m -> 1h, 4h, 1d): cualquier bot puede pedir cualquier timeframe sin más peticiones.
+
+        resampler = Resampler('5m', {'1h': 300, '4h': 300})
+        resampler.sync(exchange, 'BTC/USDT')           # una sola descarga (de 5m) por símbolo
+        closed, live = resampler.closed('BTC/USDT', '4h', exchange.milliseconds())
+
+    `windows` ({timeframe: velas}, o una lista de timeframes con DEFAULT_WINDOW velas cada uno)
+    fija cuántas velas se guardan de cada timeframe, así la memoria queda acotada
+    por la ventana que necesita cada consumidor. Semanas alineadas al lunes y meses al calendario,
+    como en Binance.
+    """
+
+    def __init__(self, base_timeframe: str, windows):
+        self.base_timeframe = base_timeframe
+        self.base_ms = timeframe_to_ms(base_timeframe)
+        if not isinstance(windows, dict):
+            windows = dict.fromkeys(windows, DEFAULT_WINDOW)
+        for timeframe in windows:
+            if not timeframe.endswith('M') and timeframe_to_ms(timeframe) % self.base_ms:
+                raise ValueError(f"{timeframe} no es múltiplo de {base_timeframe}")
+        self.windows = windows
+        self._symbols = {}
+
+    def _state(self, symbol: str) -> dict:
+        state = self._symbols.get(symbol)
+        if state is None:
+            state = self._symbols[symbol] = {
+                'last_base': None,  # última vela base: puede seguir cambiando hasta que llega la siguiente
+                'closed': {tf: deque(maxlen=n) for tf, n in self.windows.items()},
+                'partial': {tf: None for tf in self.windows},  # vela derivada en construcción (sin last_base)
+            }
+        return state
+
+    def required_since(self, now_ms: int) -> int:
+        """Desde dónde hace falta historia base para llenar la ventana de cada timeframe (más la vela en curso)."""
+        starts = []
+        for timeframe, window in self.windows.items():
+            # Meses: 31 días por vela basta para caer dentro de la vela más antigua de la ventana
+            span = int(timeframe[:-1]) * 31 * 86400 * 1000 if timeframe.endswith('M') else timeframe_to_ms(timeframe)
+            starts.append(candle_open_ms(timeframe, now_ms - window * span))
+        return min(starts)
+
+    def seed(self, symbol: str, timeframe: str, candles):
+        """
+        Carga historia cerrada de un timeframe derivado que el flujo base no cubre (por ejemplo
+        velas de 1d guardadas en el almacén local, para no descargar meses de velas de 5m).
+        Las velas que el flujo base ya cubre se ignoran: manda lo derivado del flujo base.
+        """
+        state = self._state(symbol)
+        closed = state['closed'][timeframe]
+        cutoff = closed[0][0] if closed else None
+        for pending in (state['partial'][timeframe], state['last_base']):
+            if pending is not None:
+                bucket = candle_open_ms(timeframe, pending[0])
+                cutoff = bucket if cutoff is None else min(cutoff, bucket)
+        rows = [[int(bar[0])] + [float(v) for v in bar[1:6]] for bar in candles if cutoff is None or bar[0] < cutoff]
+        rows.extend(closed)
+        closed.clear()
+        closed.extend(rows[-closed.maxlen:])
+
+    def _fold(self, state: dict, bar: list):
+        """Suma una vela base ya definitiva a la vela en construcción de cada timeframe."""
+        for timeframe, closed in state['closed'].items():
+            bucket = candle_open_ms(timeframe, bar[0])
+            partial = state['partial'][timeframe]
+            if partial is not None and partial[0] == bucket:
+                partial[2] = max(partial[2], bar[2])
+                partial[3] = min(partial[3], bar[3])
+                partial[4] = bar[4]
+                partial[5] += bar[5]
+                continue
+            if partial is not None:
+                closed.append(partial)
+            while closed and closed[-1][0] >= bucket:
+                closed.pop()  # historia sembrada que ahora cubre el flujo base
+            state['partial'][timeframe] = [bucket, bar[1], bar[2], bar[3], bar[4], bar[5]]
+
+    def update(self, symbol: str, bars):
+        """
+        Añade velas base ordenadas ([timestamp, open, high, low, close, volume]).
+        Repetir el timestamp de la última vela la reemplaza (vela base aún en formación).
+        """
+        state = self._state(symbol)
+        for bar in bars:
+            bar = [int(bar[0])] + [float(v) for v in bar[1:6]]
+            last = state['last_base']
+            if last is not None and bar[0] < last[0]:
+                continue
+            if last is not None and bar[0] > last[0]:
+                self._fold(state, last)
+            state['last_base'] = bar
+
+    def candles(self, symbol: str, timeframe: str, n: int = None) -> np.ndarray:
+        """Últimas `n` velas de `timeframe` (la última puede estar aún formándose), como array de CANDLE_DTYPE."""
+        state = self._state(symbol)
+        rows = list(state['closed'][timeframe])
+        partial = state['partial'][timeframe]
+        last = state['last_base']
+        if last is not None:
+            bucket = candle_open_ms(timeframe, last[0])
+            if partial is not None and partial[0] == bucket:
+                partial = [bucket, partial[1], max(partial[2], last[2]), min(partial[3], last[3]),
+                           last[4], partial[5] + last[5]]
+            else:
+                if partial is not None:
+                    rows.append(partial)
+                partial = [bucket] + last[1:]
+        if partial is not None:
+            rows.append(partial)
+        if n is not None:
+            rows = rows[-n:]
+        return np.array([tuple(row) for row in rows], dtype=CANDLE_DTYPE)
+
+    def closed(self, symbol: str, timeframe: str, now_ms: int, n: int = None):
+        """
+        (últimas `n` velas cerradas, vela en curso o None) de `timeframe`, igual que
+        CandleStore.sync_closed. Por defecto, toda la ventana del timeframe.
+        """
+        candles, live = split_closed(self.candles(symbol, timeframe), timeframe, now_ms)
+        return candles[-(n or self.windows[timeframe]):], live
+
+    def sync(self, exchange, symbol: str, store=candle_store):
+        """
+        Pone al día el flujo base de `symbol` con el almacén local de velas (una sola descarga,
+        solo las velas nuevas). La primera vez carga desde `required_since` (con backfill si el
+        almacén no llega) para llenar la ventana de cada timeframe.
+        """
+        state = self._state(symbol)
+        exchange_id = exchange.id
+        now = exchange.milliseconds()
+        if state['last_base'] is None:
+            since = self.required_since(now)
+            first = store.first_timestamp(exchange_id, symbol, self.base_timeframe)
+            if first is None or first > since:
+                backfill(exchange, symbol, self.base_timeframe, since, store=store)
+        else:
+            since = state['last_base'][0]
+
+        # `limit` cubre todo el hueco desde la última vela guardada, así el almacén no deja huecos
+        last = store.last_timestamp(exchange_id, symbol, self.base_timeframe) or since
+        store.sync(exchange, symbol, self.base_timeframe, max(2, (now - last) // self.base_ms + 2))
+        self.update(symbol, store.read(exchange_id, symbol, self.base_timeframe, since=since).tolist())
@@ -0,0 +1,130 @@
+import os
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from utilities.candle_store import timeframe_to_ms, candle_open_ms, next_candle_close_ms
+
+load_dotenv()
+
+# Segundos de espera tras el cierre de la vela para que el exchange la tenga publicada
+SCHEDULER_SETTLE_SEC = float(os.getenv("SCHEDULER_SETTLE_SEC", "1.0"))
+# Cada cuánto se vuelve a medir la diferencia con el reloj del exchange
+CLOCK_RESYNC_SEC = 3600
+# Reintento de una tarea alineada a velas que falló (sin esperar a la siguiente vela)
+RETRY_SEC = 60
+
+def ts():
+    """Devuelve un string de la marca de tiempo UTC."""
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+def timeframe_to_seconds(timeframe: str) -> int:
+    """Convierte un string de timeframe (ej. '1h', '4h') en segundos."""
+    return timeframe_to_ms(timeframe) // 1000
+
+class ExchangeClock:
+    """
+    Reloj alineado con el servidor del exchange: mide la diferencia con `exchange.fetch_time()`
+    y la vuelve a medir cada CLOCK_RESYNC_SEC. Sin exchange (o si falla) usa el reloj local.
+    """
+
+    def __init__(self, exchange=None, resync_sec: float = CLOCK_RESYNC_SEC):
+        self.exchange = exchange
+        self.resync_sec = resync_sec
+        self.offset_ms = 0
+        self._synced_at = None
+
+    def sync(self):
+        self._synced_at = time.monotonic()
+        if self.exchange is None:
+            return
+        try:
+            before = time.time() * 1000
+            server = self.exchange.fetch_time()
+            after = time.time() * 1000
+            self.offset_ms = int(server - (before + after) / 2)
+        except Exception as e:
+            print(f"{ts()} | No se pudo obtener la hora del exchange: {e}. Se usa el reloj local.")
+
+    def now_ms(self) -> int:
+        if self._synced_at is None or time.monotonic() - self._synced_at > self.resync_sec:
+            self.sync()
+        return int(time.time() * 1000) + self.offset_ms
+
+class Task:
+    """Tarea del planificador: `cadence` es un timeframe ('1h') o un intervalo en segundos."""
+
+    def __init__(self, cadence, func, name: str = None):
+        self.cadence = cadence
+        self.func = func
+        self.name = name or getattr(func, '__name__', 'tarea')
+        self.next_run_ms = 0
+
+    @property
+    def aligned(self) -> bool:
+        return isinstance(self.cadence, str)
+
+    def schedule_next(self, now_ms: int, settle_ms: int, failed: bool = False):
+        if self.aligned:
+            self.next_run_ms = next_candle_close_ms(self.cadence, now_ms - settle_ms) + settle_ms
+            if failed:
+                self.next_run_ms = min(self.next_run_ms, now_ms + RETRY_SEC * 1000)
+        else:
+            self.next_run_ms = now_ms + int(self.cadence * 1000)
+
+class Scheduler:
+    """
+    Ejecuta tareas justo después de cada cierre de vela (más un pequeño margen `settle_sec`)
+    usando la hora del servidor del exchange, en lugar de dormir un intervalo fijo.
+    Cada tarea tiene su propia cadencia:
+
+        scheduler = Scheduler(exchange)
+        scheduler.every('1h', escanear)      # al cierre de cada vela de 1h
+        scheduler.every(10, gestionar)       # cada 10 segundos
+        scheduler.run()
+
+    Las tareas se ejecutan una vez al arrancar. Una tarea puede llamar a `scheduler.stop()` para terminar `run`.
+    """
+
+    def __init__(self, exchange=None, settle_sec: float = SCHEDULER_SETTLE_SEC, clock: ExchangeClock = None):
+        self.clock = clock or ExchangeClock(exchange)
+        self.settle_ms = int(settle_sec * 1000)
+        self.tasks = []
+        self.stopped = False
+
+    def every(self, cadence, func, name: str = None) -> Task:
+        task = Task(cadence, func, name)
+        self.tasks.append(task)
+        return task
+
+    def stop(self):
+        self.stopped = True
+
+    def next_run_ms(self) -> int:
+        return min(task.next_run_ms for task in self.tasks)
+
+    def run_pending(self):
+        """Ejecuta las tareas que ya tocan, en el orden en que se registraron."""
+        for task in self.tasks:
+            if self.stopped:
+                return
+            now = self.clock.now_ms()
+            if now < task.next_run_ms:
+                continue
+            try:
+                task.func()
+                task.schedule_next(self.clock.now_ms(), self.settle_ms)
+            except Exception as e:
+                print(f"{ts()} | Error en la tarea {task.name}: {e}")
+                task.schedule_next(self.clock.now_ms(), self.settle_ms, failed=True)
+
+    def sleep_until_next(self, max_sleep: float = 60):
+        """Duerme hasta la próxima tarea (en tramos de como mucho `max_sleep` segundos)."""
+        delay = (self.next_run_ms() - self.clock.now_ms()) / 1000
+        if delay > 0:
+            time.sleep(min(delay, max_sleep))
+
+    def run(self):
+        while not self.stopped:
+            self.run_pending()
+            if not self.stopped:
+                self.sleep_until_next()
@@ -0,0 +1,52 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+class SharedArrays:
+    """
+    Arrays NumPy en un bloque de multiprocessing.shared_memory para que varios procesos los lean
+    sin copiarlos ni serializarlos en cada tarea:
+
+        shared = SharedArrays.create({'features': block})   # proceso principal
+        Pool(initializer=init, initargs=(shared.spec,))      # solo viaja `spec` (nombre y formas)
+        arrays = SharedArrays.attach(spec).arrays            # en cada proceso: vistas sin copia
+
+    Quien lo crea debe llamar a `unlink()` al terminar; el resto, solo a `close()`.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, layout: list):
+        self.shm = shm
+        self.layout = layout
+        self.arrays = {name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+                       for name, shape, dtype, offset in layout}
+
+    @property
+    def spec(self) -> tuple:
+        """Lo necesario para `attach` desde otro proceso (se puede serializar)."""
+        return self.shm.name, self.layout
+
+    @classmethod
+    def create(cls, arrays: dict) -> 'SharedArrays':
+        layout, offset = [], 0
+        for name, values in arrays.items():
+            values = np.asarray(values)
+            offset = -(-offset // 64) * 64  # cada array alineado a 64 bytes
+            layout.append((name, values.shape, values.dtype.str, offset))
+            offset += values.nbytes
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        shared = cls(shm, layout)
+        for name, values in arrays.items():
+            shared.arrays[name][...] = values
+        return shared
+
+    @classmethod
+    def attach(cls, spec: tuple) -> 'SharedArrays':
+        name, layout = spec
+        return cls(shared_memory.SharedMemory(name=name), layout)
+
+    def close(self):
+        self.arrays = {}
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
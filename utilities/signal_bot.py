@@ -1,4 +1,5 @@
 import os
+import sys
 import time
 import math
 from datetime import datetime
@@ -9,6 +10,13 @@ import smtplib
 from email.mime.text import MIMEText
 from dotenv import load_dotenv
 
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utilities.build_features import group_frames, record_columns, COMPACT_FEATURES, COMPACT_DTYPE
+from utilities.feature_graph import FeaturePlan
+from utilities.async_scan import AsyncScanner
+
 # ----------------------------- Utilidades -----------------------------
 
 def ts():
@@ -52,24 +60,14 @@ QUOTE_SYMBOL = os.getenv("QUOTE_SYMBOL", "USDT")
 
 # ----------------------------- Funciones de Indicadores ----------------------------
 
-def atr(df, period):
-    df['high_low'] = df['high'] - df['low']
-    df['high_close'] = np.abs(df['high'] - df['close'].shift())
-    df['low_close'] = np.abs(df['low'] - df['close'].shift())
-    df['tr'] = df[['high_low', 'high_close', 'low_close']].max(axis=1)
-    df['atr'] = df['tr'].rolling(period).mean()
-    return df['atr']
-
-def macd(df, fast, slow, signal):
-    df['ema_fast'] = df['close'].ewm(span=fast, adjust=False).mean()
-    df['ema_slow'] = df['close'].ewm(span=slow, adjust=False).mean()
-    df['macd'] = df['ema_fast'] - df['ema_slow']
-    df['macd_signal'] = df['macd'].ewm(span=signal, adjust=False).mean()
-    df['macd_hist'] = df['macd'] - df['macd_signal']
-    return df
-
-def sma(df, period):
-    return df['close'].rolling(period).mean()
+# La doble confirmación solo lee la última vela de cada indicador
+FEATURES = FeaturePlan({
+    'sma_fast': ('sma', SMA_FAST),
+    'sma_trend': ('sma', SMA_TREND),
+    'macd': ('macd', MACD_FAST, MACD_SLOW, MACD_SIGNAL),
+    'macd_signal': ('macd_signal', MACD_FAST, MACD_SLOW, MACD_SIGNAL),
+    'atr': ('atr', ATR_PERIOD, True),
+}, rows=1)
 
 # ----------------------------- Funciones de Trading -----------------------------
 
@@ -127,57 +125,39 @@ def get_top_trading_symbols(exchange, limit=NUM_SYMBOLS_TO_SCAN):
         print(f"{ts()} | ERROR al obtener los símbolos: {e}")
         return []
 
-def check_signal_and_alert(exchange, symbol):
-    print(f"{ts()} | Analizando {symbol}...")
-    try:
-        ohlcv = exchange.fetch_ohlcv(symbol, TIMEFRAME, limit=SMA_TREND + 5)
-        if not ohlcv:
+def evaluate_all_and_alert(frames: dict) -> bool:
+    """
+    Doble confirmación (SMA rápida/tendencia y MACD/señal en la última vela cerrada) de todos
+    los símbolos a la vez: los indicadores se calculan en bloque (símbolos x velas, un bloque por número de velas) y solo se alerta del
+    primer símbolo con señal, en orden. Con COMPACT_FEATURES velas e indicadores se guardan en float32.
+    """
+    last = {}
+    for symbols, arrays in group_frames(frames, dtype=COMPACT_DTYPE if COMPACT_FEATURES else np.float64):
+        if COMPACT_FEATURES:
+            features = record_columns(FEATURES.records(arrays['high'], arrays['low'], arrays['close'], COMPACT_DTYPE))
+        else:
+            features = FEATURES.arrays(arrays['high'], arrays['low'], arrays['close'])
+        longs = (features['sma_fast'][:, -1] > features['sma_trend'][:, -1]) & \
+                (features['macd'][:, -1] > features['macd_signal'][:, -1])
+        shorts = (features['sma_fast'][:, -1] < features['sma_trend'][:, -1]) & \
+                 (features['macd'][:, -1] < features['macd_signal'][:, -1])
+        for i, symbol in enumerate(symbols):
+            last[symbol] = (longs[i], shorts[i], arrays['close'][i, -1], features['atr'][i, -1])
+
+    for symbol in frames:
+        if symbol not in last:
             print(f"{ts()} | No se encontraron datos para {symbol}.")
-            return
-        
-        df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        
-        # Calcular indicadores
-        df['sma_fast'] = sma(df, SMA_FAST)
-        df['sma_trend'] = sma(df, SMA_TREND)
-        df = macd(df, MACD_FAST, MACD_SLOW, MACD_SIGNAL)
-        df['atr'] = atr(df, ATR_PERIOD)
-        
-        last_row = df.iloc[-1]
-        
-        sma_long = last_row['sma_fast'] > last_row['sma_trend']
-        macd_long = last_row['macd'] > last_row['macd_signal']
-        
-        sma_short = last_row['sma_fast'] < last_row['sma_trend']
-        macd_short = last_row['macd'] < last_row['macd_signal']
-        
-        atr_value = last_row['atr']
-        
-        # Doble confirmación y envío de alerta
-        if sma_long and macd_long:
-            side = 'long'
-            entry_price = last_row['close']
-            stop_loss = entry_price - (atr_value * ATR_K)
-            take_profit = entry_price + (atr_value * (ATR_K * TP_R_MULTIPLE))
-            send_email_alert(symbol, side, entry_price, stop_loss, take_profit)
+            continue
+        is_long, is_short, entry, atr_value = last[symbol]
+        if is_long:
+            send_email_alert(symbol, 'long', entry, entry - (atr_value * ATR_K),
+                             entry + (atr_value * (ATR_K * TP_R_MULTIPLE)))
             return True
-        elif sma_short and macd_short:
-            side = 'short'
-            entry_price = last_row['close']
-            stop_loss = entry_price + (atr_value * ATR_K)
-            take_profit = entry_price - (atr_value * (ATR_K * TP_R_MULTIPLE))
-            send_email_alert(symbol, side, entry_price, stop_loss, take_profit)
+        if is_short:
+            send_email_alert(symbol, 'short', entry, entry + (atr_value * ATR_K),
+                             entry - (atr_value * (ATR_K * TP_R_MULTIPLE)))
             return True
-        else:
-            print(f"{ts()} | No hay señal de doble confirmación en {symbol}.")
-
-    except ccxt.NetworkError as e:
-        print(f"{ts()} | ERROR de red en {symbol}: {e}")
-    except ccxt.ExchangeError as e:
-        print(f"{ts()} | ERROR del exchange en {symbol}: {e}")
-    except Exception as e:
-        print(f"{ts()} | ERROR inesperado en {symbol}: {e}")
+        print(f"{ts()} | No hay señal de doble confirmación en {symbol}.")
     return False
 
 # ----------------------------- Bucle Principal -----------------------------
@@ -193,6 +173,10 @@ def main_loop():
     
     if USE_TESTNET:
         exchange.set_sandbox_mode(True)
+    scanner = AsyncScanner(EXCHANGE_ID, {
+        'options': {'defaultType': 'future'},
+        'enableRateLimit': True,
+    }, sandbox=USE_TESTNET, compact=COMPACT_FEATURES)
     
     alert_sent = False
     while not alert_sent:
@@ -204,10 +188,8 @@ def main_loop():
                 time.sleep(60) # Espera un minuto antes de reintentar
                 continue
                 
-            for symbol in symbols_to_scan:
-                if check_signal_and_alert(exchange, symbol):
-                    alert_sent = True
-                    break
+            # Descarga concurrente de todos los símbolos y evaluación de las señales en bloque
+            alert_sent = scanner.scan_batch(symbols_to_scan, TIMEFRAME, SMA_TREND + 5, evaluate_all_and_alert)
             
             if not alert_sent:
                 print(f"{ts()} | Esperando para el próximo ciclo...")
@@ -220,5 +202,7 @@ def main_loop():
             print(f"\n{ts()} | ERROR en el bucle principal: {e}")
             time.sleep(LOOP_SLEEP_SEC)
 
+    scanner.close()
+
 if __name__ == "__main__":
     main_loop()
\ No newline at end of file
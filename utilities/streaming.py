@@ -0,0 +1,301 @@
+import math
+from collections import deque
+import numpy as np
+
+# Indicadores incrementales: se siembran una vez con la historia y después cada vela cerrada
+# cuesta O(1) (`update`). `peek` calcula el valor con la vela en formación sin tocar el estado.
+# Mismas convenciones que utilities/indicators (NaN durante el calentamiento, EMAs que arrancan
+# en el primer valor, RSI 100/0 y StochRSI 50 en los casos límite).
+
+NAN = float('nan')
+# Filas de indicadores que guarda un FeatureStream si no se indica otra cosa
+DEFAULT_HISTORY = 1000
+FEATURE_COLUMNS = ('SMA_FAST', 'SMA_TREND', 'MACD', 'MACD_SIGNAL', 'ATR', 'RSI', 'STOCH_RSI_K', 'STOCH_RSI_D')
+
+def timestamps_ms(values) -> np.ndarray:
+    """Timestamps como int64 en ms, vengan en ms (arrays de velas) o como fechas (DataFrames de los bots)."""
+    values = np.asarray(values)
+    if values.dtype.kind in 'OM':
+        return values.astype('datetime64[ms]').astype(np.int64)
+    return values.astype(np.int64)
+
+class StreamingSMA:
+    """
+    Media móvil simple con suma acumulada de la ventana. La suma se recalcula cada `period`
+    velas para que no acumule error de redondeo, y una ventana de ceros da exactamente 0.
+    """
+
+    def __init__(self, period: int):
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+        self.nonzero = 0
+        self._since_resum = 0
+
+    def _value(self, total: float, nonzero: int, count: int) -> float:
+        if count < self.period:
+            return NAN
+        return total / self.period if nonzero else 0.0
+
+    def peek(self, x: float) -> float:
+        if not self.window and math.isnan(x):
+            return NAN
+        total, nonzero, count = self.total + x, self.nonzero + (x != 0), len(self.window) + 1
+        if count > self.period:
+            old = self.window[0]
+            total, nonzero, count = total - old, nonzero - (old != 0), self.period
+        return self._value(total, nonzero, count)
+
+    def update(self, x: float) -> float:
+        if not self.window and math.isnan(x):
+            return NAN  # las SMAs arrancan en el primer valor válido
+        if len(self.window) == self.period:
+            old = self.window[0]
+            self.total -= old
+            self.nonzero -= old != 0
+        self.window.append(x)
+        self.total += x
+        self.nonzero += x != 0
+        self._since_resum += 1
+        if self._since_resum >= self.period:
+            self.total = math.fsum(self.window)
+            self._since_resum = 0
+        return self._value(self.total, self.nonzero, len(self.window))
+
+class StreamingEMA:
+    """EMA recursiva (como ewm(adjust=False)): arranca en el primer valor válido."""
+
+    def __init__(self, span: int = None, alpha: float = None):
+        self.alpha = alpha if alpha is not None else 2.0 / (span + 1.0)
+        self.value = None
+
+    def peek(self, x: float) -> float:
+        if self.value is None:
+            return x
+        return self.alpha * x + (1.0 - self.alpha) * self.value
+
+    def update(self, x: float) -> float:
+        if self.value is None and math.isnan(x):
+            return NAN
+        self.value = self.peek(x)
+        return self.value
+
+class StreamingMACD:
+    """Devuelve (línea MACD, línea de señal, histograma) vela a vela."""
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast = StreamingEMA(fast)
+        self.slow = StreamingEMA(slow)
+        self.signal = StreamingEMA(signal)
+
+    def peek(self, close: float):
+        line = self.fast.peek(close) - self.slow.peek(close)
+        signal = self.signal.peek(line)
+        return line, signal, line - signal
+
+    def update(self, close: float):
+        line = self.fast.update(close) - self.slow.update(close)
+        signal = self.signal.update(line)
+        return line, signal, line - signal
+
+class StreamingATR:
+    """ATR como media simple del rango verdadero (misma opción `first_bar_range` que indicators.atr)."""
+
+    def __init__(self, period: int = 14, first_bar_range: bool = False):
+        self.sma = StreamingSMA(period)
+        self.first_bar_range = first_bar_range
+        self.prev_close = None
+
+    def _true_range(self, high: float, low: float) -> float:
+        if self.prev_close is None:
+            return high - low if self.first_bar_range else NAN
+        return max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+
+    def peek(self, high: float, low: float, close: float) -> float:
+        return self.sma.peek(self._true_range(high, low))
+
+    def update(self, high: float, low: float, close: float) -> float:
+        value = self.sma.update(self._true_range(high, low))
+        self.prev_close = close
+        return value
+
+class StreamingRSI:
+    """RSI con medias simples de subidas y bajadas, como indicators.rsi."""
+
+    def __init__(self, period: int = 14):
+        self.gain = StreamingSMA(period)
+        self.loss = StreamingSMA(period)
+        self.prev_close = None
+
+    @staticmethod
+    def _value(gain: float, loss: float) -> float:
+        if gain == 0:
+            return 0.0
+        if loss == 0:
+            return 100.0
+        return 100.0 - 100.0 / (1.0 + gain / loss)
+
+    def _delta(self, close: float) -> float:
+        return 0.0 if self.prev_close is None else close - self.prev_close
+
+    def peek(self, close: float) -> float:
+        delta = self._delta(close)
+        return self._value(self.gain.peek(max(delta, 0.0)), self.loss.peek(max(-delta, 0.0)))
+
+    def update(self, close: float) -> float:
+        delta = self._delta(close)
+        self.prev_close = close
+        return self._value(self.gain.update(max(delta, 0.0)), self.loss.update(max(-delta, 0.0)))
+
+class RollingExtreme:
+    """
+    Mínimo (o máximo) de las últimas `period` velas con una deque monótona: O(1) amortizado.
+    Si la ventana contiene algún NaN el resultado es NaN, como en indicators.rolling_min/max.
+    """
+
+    def __init__(self, period: int, mode: str = 'min'):
+        self.period = period
+        self.is_min = mode == 'min'
+        self.items = deque()  # (índice, valor) con valores monótonos desde el extremo actual
+        self.count = 0
+        self.last_nan = -1
+
+    def _beats(self, a: float, b: float) -> bool:
+        return a <= b if self.is_min else a >= b
+
+    def _value(self, i: int, front, x: float) -> float:
+        if i < self.period - 1 or self.last_nan > i - self.period or math.isnan(x):
+            return NAN
+        if front is None or self._beats(x, front):
+            return x
+        return front
+
+    def peek(self, x: float) -> float:
+        i = self.count
+        # Al entrar `x` sale como mucho el elemento del frente
+        front = None
+        for index, value in self.items:
+            if index > i - self.period:
+                front = value
+                break
+        return self._value(i, front, x)
+
+    def update(self, x: float) -> float:
+        i = self.count
+        self.count += 1
+        if math.isnan(x):
+            self.last_nan = i
+        else:
+            while self.items and self._beats(x, self.items[-1][1]):
+                self.items.pop()
+            self.items.append((i, x))
+        while self.items and self.items[0][0] <= i - self.period:
+            self.items.popleft()
+        if math.isnan(x):
+            return NAN
+        return self._value(i, self.items[0][1], x)
+
+class StreamingStochRSI:
+    """%K y %D del Stochastic RSI a partir de valores de RSI, como indicators.stoch_rsi."""
+
+    def __init__(self, period: int = 14, d_period: int = None):
+        self.low = RollingExtreme(period, 'min')
+        self.high = RollingExtreme(period, 'max')
+        self.d = StreamingSMA(d_period or period)
+
+    @staticmethod
+    def _k(rsi: float, low: float, high: float) -> float:
+        if high == low:
+            return 50.0
+        return 100.0 * (rsi - low) / (high - low)
+
+    def peek(self, rsi: float):
+        k = self._k(rsi, self.low.peek(rsi), self.high.peek(rsi))
+        return k, self.d.peek(k)
+
+    def update(self, rsi: float):
+        k = self._k(rsi, self.low.update(rsi), self.high.update(rsi))
+        return k, self.d.update(k)
+
+class FeatureStream:
+    """
+    Versión incremental de utilities.build_features.build_features para una serie de velas:
+
+        stream = FeatureStream()
+        stream.seed(closed)                    # una vez, con las velas cerradas
+        stream.update(candle)                  # O(1) por cada vela que cierra
+        stream.peek(live)                      # indicadores con la vela en formación
+        stream.columns(250)                    # últimas 250 filas de cada indicador
+
+    Las velas son dicts (o filas) con timestamp, open, high, low, close y volume. Guarda las
+    últimas `history` filas de indicadores. Las EMAs recuerdan toda la historia sembrada, no solo
+    la ventana: la diferencia con recalcular la ventana es del orden del redondeo.
+    """
+
+    def __init__(self, sma_fast: int = 30, sma_trend: int = 200, macd=(12, 26, 9), atr_period: int = 14,
+                 rsi_period: int = 14, stoch_rsi_period: int = 14, history: int = DEFAULT_HISTORY):
+        self.sma_fast = StreamingSMA(sma_fast)
+        self.sma_trend = StreamingSMA(sma_trend)
+        self.macd = StreamingMACD(*macd)
+        self.atr = StreamingATR(atr_period)
+        self.rsi = StreamingRSI(rsi_period)
+        self.stoch_rsi = StreamingStochRSI(stoch_rsi_period)
+        self.rows = deque(maxlen=history)
+        self.last_timestamp = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _step(self, high: float, low: float, close: float, commit: bool) -> tuple:
+        step = 'update' if commit else 'peek'
+        macd_line, signal_line, _ = getattr(self.macd, step)(close)
+        rsi = getattr(self.rsi, step)(close)
+        stoch_k, stoch_d = getattr(self.stoch_rsi, step)(rsi)
+        return (getattr(self.sma_fast, step)(close), getattr(self.sma_trend, step)(close), macd_line, signal_line,
+                getattr(self.atr, step)(high, low, close), rsi, stoch_k, stoch_d)
+
+    def update(self, candle) -> dict:
+        """Avanza con una vela cerrada y devuelve sus indicadores."""
+        row = self._step(float(candle['high']), float(candle['low']), float(candle['close']), commit=True)
+        self.rows.append(row)
+        self.last_timestamp = int(timestamps_ms([candle['timestamp']])[0])
+        return dict(zip(FEATURE_COLUMNS, row))
+
+    def peek(self, candle) -> dict:
+        """Indicadores que tendría la vela en formación si cerrara ahora (no cambia el estado)."""
+        row = self._step(float(candle['high']), float(candle['low']), float(candle['close']), commit=False)
+        return dict(zip(FEATURE_COLUMNS, row))
+
+    def _feed(self, timestamps, high, low, close):
+        for i in range(len(timestamps)):
+            self.rows.append(self._step(float(high[i]), float(low[i]), float(close[i]), commit=True))
+        if len(timestamps):
+            self.last_timestamp = int(timestamps[-1])
+
+    def seed(self, df):
+        """Siembra con velas cerradas (DataFrame o array de velas). Solo se llama una vez."""
+        self._feed(timestamps_ms(df['timestamp']), np.asarray(df['high']), np.asarray(df['low']), np.asarray(df['close']))
+
+    def extend(self, df) -> bool:
+        """
+        Avanza con las velas de `df` posteriores a la última procesada. Devuelve False (sin tocar
+        el estado) si `df` no empieza antes de esa vela o si no quedarían filas para cubrir todo `df`.
+        """
+        timestamps = timestamps_ms(df['timestamp'])
+        if self.last_timestamp is None:
+            return False
+        start = int(np.searchsorted(timestamps, self.last_timestamp))
+        if start == len(timestamps) or timestamps[start] != self.last_timestamp:
+            return False
+        new = len(timestamps) - start - 1
+        if min(len(self.rows) + new, self.rows.maxlen) < len(timestamps):
+            return False
+        s = slice(start + 1, None)
+        self._feed(timestamps[s], np.asarray(df['high'])[s], np.asarray(df['low'])[s], np.asarray(df['close'])[s])
+        return True
+
+    def columns(self, n: int = None) -> dict:
+        """Últimas `n` filas de cada indicador como arrays float64 ({columna: array})."""
+        rows = list(self.rows)[-n:] if n else list(self.rows)
+        values = np.array(rows, dtype=np.float64).reshape(len(rows), len(FEATURE_COLUMNS))
+        return {name: values[:, i] for i, name in enumerate(FEATURE_COLUMNS)}